@@ -1,46 +1,104 @@
 from discord.ext import commands
-import openai
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-import os
-import asyncio  # Added for asynchronous operations
+import re
+import time
+from collections import deque
+from ..utility.config_utils import settings_service
+from ..utility.metrics import metrics
+from ..utility.permission_utils import is_mod
+from ..utility.send_scheduler import BULK
+from ..utility.conversation_memory import ConversationMemory, SUMMARY_PROMPT
+from ..utility.summarizer import estimate_tokens
+from ..utility.ttl_cache import TTLCache, normalize_text, text_key
 
-load_dotenv()
-OPENAI_API_KEY = os.getenv('GPT4O_API_KEY')
-XAI_API_KEY = os.getenv('GROK3_API_KEY')
-
-# Set up OpenAI client for OpenAI API
-openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
-
-# Set up OpenAI client for xAI Grok 3 API
-xai_client = openai.OpenAI(
-    api_key=XAI_API_KEY,
-    base_url="https://api.x.ai/v1"
-)
+CONVERSATION_TIMEOUT = 300  # Seconds of inactivity before a conversation ends
+EDIT_INTERVAL = 1.2  # Seconds between progressive edits; Discord allows about 5 edits per 5s per channel
+MAX_MESSAGE_LENGTH = 2000
+PUNCTUATION = re.compile(r"[^\w\s]")
+SMALL_TALK = [
+    "hi", "hey", "hello", "yo", "sup", "bye", "goodbye", "thanks", "thank you", "ty", "ok", "okay", "cool",
+    "nice", "lol", "lmao", "haha", "yes", "no", "yeah", "nope", "good morning", "good night", "how are you",
+    "whats up", "im good"
+]
 
 class Conversation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.conversation_states = {}  # (user_id, channel_id): [messages]
-        self.last_message_time = {}  # (user_id, channel_id): datetime
-
-    async def check_timeout(self):
-        while True:
-            current_time = datetime.utcnow()
-            for key in list(self.conversation_states.keys()):
-                if key in self.last_message_time:
-                    if current_time - self.last_message_time[key] > timedelta(minutes=5):
-                        user_id, channel_id = key
-                        channel = self.bot.get_channel(channel_id)
-                        if channel:
-                            await channel.send(f"<@{user_id}>, conversation ended due to inactivity.")
-                        del self.conversation_states[key]
-                        del self.last_message_time[key]
-            await asyncio.sleep(60)
-
-    @commands.Cog.listener()
-    async def on_ready(self):
-        self.bot.loop.create_task(self.check_timeout())
+        self.conversation_states = {}  # (user_id, channel_id): ConversationMemory
+        self.memory_settings = settings_service.data.get('conversation', {})
+        self.streaming = self.memory_settings.get('stream', True)
+        self.reply_metrics = deque(maxlen=200)  # (time to first token, time to complete) in seconds
+        settings = self.memory_settings
+        self.search_cache = TTLCache(
+            max_size=settings.get('searchCacheSize', 512),
+            ttl=settings.get('searchCacheTtl', 600)
+        )
+        self.search_min_words = settings.get('searchMinWords', 3)
+        self.small_talk = {search_text(phrase) for phrase in settings.get('smallTalk', SMALL_TALK)}
+        self.search_skips = 0
+        metrics.gauge("leobot_open_conversations", "Conversations in progress.", lambda: len(self.conversation_states))
+
+    def needs_search(self, content):
+        text = search_text(content)
+        return len(text.split()) >= self.search_min_words and text not in self.small_talk
+
+    async def search_context(self, content):
+        # The Grok step is deterministic (temperature 0), so identical prompts
+        # can share a result until it expires.
+        if not self.needs_search(content):
+            self.search_skips += 1
+            return None
+        key = text_key(search_text(content))
+        result = self.search_cache.get(key)
+        if result is None:
+            result = await self.bot.llm["grok"].chat(
+                model="grok-3-beta",  # Updated to match available model
+                messages=[
+                    {"role": "system", "content": "You are a test assistant."},
+                    {"role": "user", "content": content}
+                ],
+                temperature=0  # Match screen's deterministic setting
+            )
+            self.search_cache.set(key, result)
+        return result
+
+    def new_memory(self):
+        settings = self.memory_settings
+        return ConversationMemory(
+            token_budget=settings.get('contextTokens', 1500),
+            max_turns=settings.get('maxTurns', 24),
+            compress_after=settings.get('compressAfter', 12),
+            keep_recent=settings.get('keepRecent', 6)
+        )
+
+    def end(self, key):
+        memory = self.conversation_states.pop(key, None)
+        if memory:
+            memory.cancel()
+        self.bot.router.release(key)
+        self.bot.scheduler.cancel(("conversation", key))
+
+    async def summarize_turns(self, summary, turns):
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        return await self.bot.llm["gpt"].chat(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Current summary: {summary or '(none)'}\n\nNew turns:\n{transcript}"}
+            ],
+            max_tokens=200
+        )
+
+    async def expire(self, key):
+        if key not in self.conversation_states:
+            return
+        user_id, channel_id = key
+        self.end(key)
+        channel = self.bot.get_channel(channel_id)
+        if channel:
+            self.bot.sender.submit(channel, f"<@{user_id}>, conversation ended due to inactivity.", priority=BULK, merge=True)
+
+    def touch(self, key):
+        self.bot.scheduler.schedule(("conversation", key), CONVERSATION_TIMEOUT, lambda: self.expire(key))
 
     @commands.command()
     async def conversation(self, ctx):
@@ -48,8 +106,9 @@ class Conversation(commands.Cog):
         if key in self.conversation_states:
             await ctx.send("You're already in a conversation in this channel!")
             return
-        self.conversation_states[key] = []
-        self.last_message_time[key] = datetime.utcnow()
+        self.conversation_states[key] = self.new_memory()
+        self.bot.router.claim(key, "conversation", self.handle_message)
+        self.touch(key)
         await ctx.send(f"{ctx.author.mention}, conversation started! Type your messages, and I'll respond.")
 
     @commands.command()
@@ -58,52 +117,113 @@ class Conversation(commands.Cog):
         if key not in self.conversation_states:
             await ctx.send("No active conversation in this channel.")
             return
-        del self.conversation_states[key]
-        del self.last_message_time[key]
+        self.end(key)
         await ctx.send("Conversation ended.")
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
+    async def stream_reply(self, message, started, conversation_messages):
+        # Post as soon as the first tokens arrive, then edit the same message
+        # at most once per EDIT_INTERVAL and once more when the stream ends.
+        prefix = f"{message.author.mention} "
+        reply = ""
+        sent = None
+        shown = ""
+        first_token = None
+        last_edit = 0.0
+        async for delta in self.bot.llm["gpt"].stream_chat(
+            model="gpt-3.5-turbo",
+            messages=conversation_messages,
+            max_tokens=100
+        ):
+            reply += delta
+            now = time.monotonic()
+            if sent is None:
+                first_token = now - started
+                shown = reply
+                sent = await self.bot.sender.send(message.channel, (prefix + shown)[:MAX_MESSAGE_LENGTH])
+                last_edit = time.monotonic()
+            elif now - last_edit >= EDIT_INTERVAL:
+                shown = reply
+                await sent.edit(content=(prefix + shown)[:MAX_MESSAGE_LENGTH])
+                last_edit = time.monotonic()
+        if sent is None:
+            raise RuntimeError("Empty reply from model")
+        if shown != reply:
+            await sent.edit(content=(prefix + reply)[:MAX_MESSAGE_LENGTH])
+        self.record_reply(first_token, time.monotonic() - started)
+        return reply
+
+    def record_reply(self, first_token, completed):
+        self.reply_metrics.append((first_token, completed))
+        metrics.observe("leobot_conversation_reply_seconds", first_token, phase="first_token")
+        metrics.observe("leobot_conversation_reply_seconds", completed, phase="complete")
+
+    @commands.command()
+    async def conversationstats(self, ctx):
+        if not is_mod(ctx.author):
+            await ctx.send("You don't have permission to use this command.")
             return
+        if not self.reply_metrics:
+            await ctx.send("No conversation replies recorded yet.")
+            return
+        first_tokens = sorted(m[0] for m in self.reply_metrics)
+        completes = sorted(m[1] for m in self.reply_metrics)
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(p * len(values)))]
+        await ctx.send(
+            f"Conversation reply latency (last {len(completes)} replies):\n"
+            f"- Time to first token: p50 {percentile(first_tokens, 0.5):.2f}s, p95 {percentile(first_tokens, 0.95):.2f}s\n"
+            f"- Time to complete: p50 {percentile(completes, 0.5):.2f}s, p95 {percentile(completes, 0.95):.2f}s\n"
+            f"- Search step: {self.search_skips} skipped, cache hit rate {self.search_cache.hit_rate():.1%} ({len(self.search_cache)} entries)"
+        )
+
+    def cog_unload(self):
+        self.bot.router.unregister("conversation")
+        metrics.remove_gauge("leobot_open_conversations")
+        for key in list(self.conversation_states):
+            self.end(key)
+
+    async def handle_message(self, message):
         key = (message.author.id, message.channel.id)
         if key not in self.conversation_states:
             return
-        self.conversation_states[key].append({"role": "user", "content": message.content})
-        self.last_message_time[key] = datetime.utcnow()
+        memory = self.conversation_states[key]
+        memory.add("user", message.content)
+        self.touch(key)
+        started = time.monotonic()
         try:
-            # Step 1: Use Grok 3 for chat completion with web search capability
-            search_response = xai_client.chat.completions.create(
-                model="grok-3-beta",  # Updated to match available model
-                messages=[
-                    {"role": "system", "content": "You are a test assistant."},
-                    {"role": "user", "content": message.content}
-                ],
-                temperature=0,  # Match screen's deterministic setting
-                stream=False  # Implicit in non-streaming, but ensure
-            )
-            search_result = search_response.choices[0].message.content
-            print(f"Grok 3 search result: {search_result}")
+            # Step 1: Use Grok 3 for chat completion with web search capability (cached, skipped for small talk)
+            search_result = await self.search_context(message.content)
 
             # Step 2: Use OpenAI to generate a conversational response with the search result as context
-            conversation_messages = self.conversation_states[key][-10:]
-            conversation_messages.append({"role": "system", "content": f"Recent information: {search_result}"})
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=conversation_messages,
-                max_tokens=100
-            )
-            reply = response.choices[0].message.content  # Fixed to use attribute access
-            self.conversation_states[key].append({"role": "assistant", "content": reply})
-            await message.channel.send(f"{message.author.mention} {reply}")
+            if search_result:
+                search_context = f"Recent information: {search_result}"
+                conversation_messages = memory.context(reserved_tokens=estimate_tokens(search_context))
+                conversation_messages.append({"role": "system", "content": search_context})
+            else:
+                conversation_messages = memory.context()
+            if self.streaming:
+                reply = await self.stream_reply(message, started, conversation_messages)
+            else:
+                reply = await self.bot.llm["gpt"].chat(
+                    model="gpt-3.5-turbo",
+                    messages=conversation_messages,
+                    max_tokens=100
+                )
+                await self.bot.sender.send(message.channel, f"{message.author.mention} {reply}")
+                # Without streaming the whole reply arrives at once.
+                elapsed = time.monotonic() - started
+                self.record_reply(elapsed, elapsed)
+            memory.add("assistant", reply)
+            memory.maybe_compress(self.summarize_turns)
         except Exception as e:
-            await message.channel.send("Sorry, I had an issue responding. Try again!")
+            await self.bot.sender.send(message.channel, "Sorry, I had an issue responding. Try again!")
             print(f"Error: {e}")
             # Clear conversation state on error to prevent stuck states
-            del self.conversation_states[key]
-            del self.last_message_time[key]
-            await message.channel.send("Conversation ended due to an error.")
-        await self.bot.process_commands(message)
+            self.end(key)
+            await self.bot.sender.send(message.channel, "Conversation ended due to an error.")
+
+def search_text(content):
+    return normalize_text(PUNCTUATION.sub("", content))
 
 async def setup(bot):
     await bot.add_cog(Conversation(bot))
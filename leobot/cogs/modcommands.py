@@ -1,5 +1,6 @@
 from discord.ext import commands
-from ..utility.config_utils import bot_settings
+from ..utility.config_utils import guild_settings
+from ..utility.metrics import metrics
 from ..utility.permission_utils import is_mod
 
 class ModCommands(commands.Cog):
@@ -11,16 +12,95 @@ class ModCommands(commands.Cog):
         if not is_mod(ctx.author):
             await ctx.send("You don't have permission to use this command.")
             return
-        mod_channel = bot_settings.get('channelIds', {}).get('modChannel')
+        mod_channel = guild_settings(ctx.guild and ctx.guild.id).channel('modChannel')
         if mod_channel and ctx.channel.id != mod_channel:
             await ctx.send("This command can only be used in the mod-only channel.")
             return
         mod_commands = [
             ("givetokens", "Give sleep tokens to members"),
-            ("trivia", "Start a trivia game")
+            ("trivia", "Start a trivia game"),
+            ("httpstats", "Show outbound HTTP connection pool statistics"),
+            ("moderationstats", "Show moderation prefilter, cache and batch statistics"),
+            ("conversationstats", "Show conversation reply latency"),
+            ("routerstats", "Show message handler timings"),
+            ("stats", "Show latency percentiles, outbound call timings, queue depths and event loop lag")
         ]
         message = "Mod Commands:\n" + "\n".join(f"- {cmd}: {desc}" for cmd, desc in mod_commands)
         await ctx.send(message)
 
+    @commands.command()
+    async def httpstats(self, ctx):
+        if not is_mod(ctx.author):
+            await ctx.send("You don't have permission to use this command.")
+            return
+        stats = self.bot.http_pool.pool_stats()
+        await ctx.send(
+            "HTTP Pool Stats:\n"
+            f"- Requests: {stats['requests']}\n"
+            f"- Connections created: {stats['connections_created']}\n"
+            f"- Connections reused: {stats['connections_reused']}\n"
+            f"- Reuse rate: {stats['reuse_rate']:.1%}\n"
+            f"- DNS cache hits/misses: {stats['dns_cache_hits']}/{stats['dns_cache_misses']}\n"
+            f"- Errors: {stats['errors']}"
+        )
+
+    @commands.command()
+    async def routerstats(self, ctx):
+        if not is_mod(ctx.author):
+            await ctx.send("You don't have permission to use this command.")
+            return
+        stats = self.bot.router.stats()
+        lines = [
+            f"- {name}: {s['calls']} calls, avg {s['avg'] * 1000:.1f}ms, max {s['max'] * 1000:.1f}ms"
+            for name, s in sorted(stats.items())
+        ]
+        sends = self.bot.sender.stats
+        lines.append(f"- sends: {sends['requested']} requested, {sends['sent']} sent, {sends['rate_limited']} rate limited")
+        await ctx.send("Message Router Stats:\n" + "\n".join(lines))
+
+    @commands.command()
+    async def stats(self, ctx):
+        if not is_mod(ctx.author):
+            await ctx.send("You don't have permission to use this command.")
+            return
+        sections = [
+            ("Commands", "leobot_command_seconds"),
+            ("Message handlers", "leobot_handler_seconds"),
+            ("Outbound calls", "leobot_outbound_seconds"),
+            ("Discord sends", "leobot_discord_send_seconds"),
+            ("Storage", "leobot_storage_seconds"),
+            ("Disk writes", "leobot_disk_write_seconds")
+        ]
+        lines = ["Bot Stats:"]
+        for title, name in sections:
+            series = metrics.series(name)
+            if not series:
+                continue
+            lines.append(f"**{title}**")
+            # Busiest series first, at most eight per section.
+            for labels, histogram in sorted(series.items(), key=lambda item: -item[1].count)[:8]:
+                label = "/".join(str(value) for _, value in labels) or "all"
+                lines.append(
+                    f"- {label}: {histogram.count} calls, p50 {histogram.quantile(0.5) * 1000:.0f}ms, "
+                    f"p95 {histogram.quantile(0.95) * 1000:.0f}ms, max {histogram.max * 1000:.0f}ms"
+                )
+        lag = metrics.series("leobot_event_loop_lag_seconds").get(())
+        if lag is not None:
+            lines.append(
+                f"**Event loop lag**: last {self.bot.loop_lag.last * 1000:.1f}ms, "
+                f"p95 {lag.quantile(0.95) * 1000:.1f}ms, max {lag.max * 1000:.1f}ms"
+            )
+        gauges = []
+        for name, (_, read) in sorted(metrics.gauges.items()):
+            if name.startswith("leobot_event_loop"):
+                continue
+            try:
+                gauges.append(f"{name[len('leobot_'):]} {read()}")
+            except Exception:
+                continue
+        if gauges:
+            lines.append("**Queues**: " + ", ".join(gauges))
+        await ctx.send("\n".join(lines)[:2000])
+
 async def setup(bot):
     await bot.add_cog(ModCommands(bot))
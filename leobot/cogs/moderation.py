@@ -1,43 +1,125 @@
 import discord
 from discord.ext import commands
-import aiohttp
+import json
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 GROK3_API_KEY = os.getenv('GROK3_API_KEY')
 
-from ..utility.utility_functions import load_json, save_json
+from ..utility.config_utils import settings_service
+from ..utility.metrics import metrics
+from ..utility.moderation_filter import ModerationPrefilter
+from ..utility.moderation_queue import ModerationBatcher
+from ..utility.permission_utils import is_mod
+from ..utility.send_scheduler import BULK
+from ..utility.ttl_cache import TTLCache, text_key
+
+BATCH_PROMPT = (
+    "Analyze each numbered message below for harassment, sexual content, or argumentative behavior. "
+    "Do not consider autism or related terms as ableist. "
+    "Respond only with a JSON array containing one verdict per message, in order, "
+    "each either 'inappropriate' if any issues are found or 'appropriate' otherwise.\n\n"
+)
+VERDICTS = {'appropriate', 'inappropriate'}
 
 class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.violations = load_json('data/violations.json')
+        settings = settings_service.data.get('moderation', {})
+        self.batcher = ModerationBatcher(
+            self.classify_batch,
+            self.handle_verdict,
+            window=settings.get('batchWindow', 2.0),
+            batch_size=settings.get('batchSize', 20),
+            max_queue=settings.get('maxQueue', 500)
+        )
+        self.prefilter = ModerationPrefilter(settings)
+        self.verdict_cache = TTLCache(
+            max_size=settings.get('cacheSize', 10000),
+            ttl=settings.get('cacheTtl', 3600)
+        )
+        bot.router.register("moderation", "moderation", self.screen)
+        metrics.gauge("leobot_moderation_queue", "Messages waiting for a moderation batch.", self.batcher.queue.qsize)
+
+    def cog_unload(self):
+        self.bot.router.unregister("moderation")
+        metrics.remove_gauge("leobot_moderation_queue")
+        self.batcher.close()
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
+    async def classify_batch(self, contents):
+        numbered = "\n".join(f"{i + 1}. {json.dumps(content)}" for i, content in enumerate(contents))
+        session = self.bot.http_pool.session
+        async with session.post(
+            "[invalid url, do not cite]",  # Hypothetical endpoint
+            headers={"Authorization": f"Bearer {GROK3_API_KEY}"},
+            json={
+                "model": "grok3",
+                "messages": [{"role": "user", "content": BATCH_PROMPT + numbered}]
+            }
+        ) as resp:
+            if resp.status != 200:
+                return [None] * len(contents)
+            data = await resp.json()
+        reply = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+        return parse_verdicts(reply, len(contents))
+
+    async def handle_verdict(self, message, verdict, cache=True):
+        # None means the model gave no verdict (failed request, missing or
+        # unreadable entry): let the message through but don't cache that.
+        if cache and verdict is not None:
+            self.verdict_cache.set(text_key(message.content), verdict)
+        if verdict != 'inappropriate':
             return
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "[invalid url, do not cite]",  # Hypothetical endpoint
-                headers={"Authorization": f"Bearer {GROK3_API_KEY}"},
-                json={
-                    "model": "grok3",
-                    "messages": [{
-                        "role": "user",
-                        "content": f"Analyze this message for harassment, sexual content, or argumentative behavior. Do not consider autism or related terms as ableist. Respond with 'inappropriate' if any issues are found, otherwise 'appropriate': {message.content}"
-                    }]
-                }
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    if data.get('choices', [{}])[0].get('message', {}).get('content', '').lower() == 'inappropriate':
-                        user_id = str(message.author.id)
-                        self.violations[user_id] = self.violations.get(user_id, 0) + 1
-                        save_json('data/violations.json', self.violations)
-                        await message.channel.send(f"{message.author.mention}, your message was flagged for inappropriate behavior. Violation count: {self.violations[user_id]}")
-        await self.bot.process_commands(message)
+        count = await self.bot.storage.add_violation(message.guild.id, message.author.id)
+        # Flags from one batch share a channel message when they fit.
+        self.bot.sender.submit(
+            message.channel,
+            f"{message.author.mention}, your message was flagged for inappropriate behavior. Violation count: {count}",
+            priority=BULK,
+            merge=True
+        )
+
+    async def screen(self, message):
+        if message.guild is None:
+            return  # Violations are counted per guild; DMs with the bot aren't moderated.
+        verdict = self.prefilter.check(message.content)
+        if verdict is None:
+            verdict = self.verdict_cache.get(text_key(message.content))
+        if verdict is None:
+            if not self.batcher.submit(message):
+                metrics.inc("leobot_moderation_dropped_total")
+        else:
+            await self.handle_verdict(message, verdict, cache=False)
+
+    @commands.command()
+    async def moderationstats(self, ctx):
+        if not is_mod(ctx.author):
+            await ctx.send("You don't have permission to use this command.")
+            return
+        prefilter = self.prefilter.stats
+        await ctx.send(
+            "Moderation Stats:\n"
+            f"- Prefilter checked: {prefilter['checked']}, skipped: {self.prefilter.skip_rate():.1%} "
+            f"({prefilter['appropriate']} appropriate, {prefilter['inappropriate']} flagged)\n"
+            f"- Verdict cache: {len(self.verdict_cache)} entries, hit rate {self.verdict_cache.hit_rate():.1%}\n"
+            f"- Batches sent: {self.batcher.stats['batches']} ({self.batcher.stats['messages']} messages, "
+            f"{self.batcher.throughput():.2f} msg/s, {self.batcher.stats['dropped']} dropped while the queue was full)"
+        )
+
+def parse_verdicts(reply, count):
+    # Anything missing or unparseable comes back as None, which is let
+    # through like the old per-message behaviour but never cached.
+    start, end = reply.find('['), reply.rfind(']')
+    try:
+        verdicts = json.loads(reply[start:end + 1]) if start != -1 and end > start else []
+    except json.JSONDecodeError:
+        verdicts = []
+    if not isinstance(verdicts, list):
+        verdicts = []
+    verdicts = [str(v).strip().lower() for v in verdicts[:count]]
+    verdicts = [v if v in VERDICTS else None for v in verdicts]
+    return verdicts + [None] * (count - len(verdicts))
 
 async def setup(bot):
     await bot.add_cog(Moderation(bot))
@@ -1,112 +1,155 @@
 import discord
 from discord.ext import commands
-import asyncio
-from ..utility.config_utils import bot_settings
-from ..utility.utility_functions import load_json, save_json
+import time
+from ..utility.config_utils import guild_settings
+from ..utility.forms import CANCEL, Form, Step
+from ..utility.player_cards import FIELD_ALIASES, FIELD_NAMES, FIELDS, CardIndex, parse_query, render_card
+
+MAX_RESULTS = 25
 
 class PlayerCard(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.index = CardIndex()
+        bot.forms.register(Form(
+            "changecolor",
+            [Step("color", color_prompt, parse_color, invalid=CANCEL)],
+            self.finish_changecolor,
+            timeout=60,
+            timeout_message="Invalid input or timeout. Color unchanged."
+        ))
+        bot.forms.register(Form(
+            "playercard",
+            [Step(field, question) for field, question, _ in FIELDS],
+            self.finish_playercard,
+            timeout=300,
+            timeout_message="Timed out. Player card creation cancelled."
+        ))
+
+    def cog_unload(self):
+        self.bot.forms.unregister("changecolor")
+        self.bot.forms.unregister("playercard")
+
+    async def cog_load(self):
+        await self.load_index()
+
+    async def load_index(self):
+        index = CardIndex()
+        for guild_id, cards in (await self.bot.storage.all_playercards()).items():
+            for user_id, fields in cards.items():
+                index.add(guild_id, user_id, fields)
+        self.index = index
+
+    @commands.Cog.listener()
+    async def on_legacy_adopted(self, guild_id):
+        await self.load_index()
 
     @commands.command()
+    @commands.guild_only()
     async def changecolor(self, ctx):
-        color_roles = bot_settings.get('colorRoles', {})
-        colors_list = list(color_roles.keys())
-        color_options = "\n".join(f"{i+1}. {name}" for i, name in enumerate(colors_list))
-        await ctx.send(f"Choose a color:\n{color_options}\nOr type the color name (case-insensitive):")
-        
-        def check(m):
-            return m.author == ctx.author and m.channel == ctx.channel
-        
-        try:
-            msg = await self.bot.wait_for('message', check=check, timeout=60)
-            user_input = msg.content.strip().lower()
-            
-            try:
-                selection = int(user_input) - 1
-                if 0 <= selection < len(colors_list):
-                    selected_color = colors_list[selection]
-                else:
-                    raise ValueError("Invalid selection number.")
-            except ValueError:
-                selected_color = next((name for name in colors_list if name.lower() == user_input), None)
-                if selected_color is None:
-                    raise ValueError("Invalid color name.")
-            
-            selected_hex = color_roles[selected_color]
-            color_role = discord.utils.get(ctx.guild.roles, name=selected_color)
-            if not color_role:
-                color_role = await ctx.guild.create_role(name=selected_color, color=discord.Color.from_str(selected_hex))
-            
-            current_color_roles = [role for role in ctx.author.roles if role.name in colors_list]
-            for role in current_color_roles:
-                await ctx.author.remove_roles(role)
-            
-            per_user_role_name = str(ctx.author.id)
-            per_user_role = discord.utils.get(ctx.guild.roles, name=per_user_role_name)
-            if per_user_role:
-                await ctx.author.remove_roles(per_user_role)
-            
-            await ctx.author.add_roles(color_role)
-            
-            config = load_json('data/config.json')
-            config[str(ctx.author.id)] = {"color": selected_hex, "playercard": config.get(str(ctx.author.id), {}).get("playercard", None)}
-            save_json('data/config.json', config)
-            
-            await ctx.send(f"Color updated to {selected_color}! Hex code: {selected_hex}")
-        
-        except (ValueError, asyncio.TimeoutError):
-            await ctx.send("Invalid input or timeout. Color unchanged.")
+        color_roles = guild_settings(ctx.guild.id).color_roles
+        context = {"guild_id": ctx.guild.id, "colors": color_roles}
+        await self.bot.forms.start("changecolor", ctx.author.id, ctx.channel, context)
+
+    async def finish_changecolor(self, session):
+        guild = self.bot.get_guild(session.context["guild_id"])
+        channel = await self.bot.forms.channel(session.channel_id)
+        member = guild.get_member(session.user_id) or await guild.fetch_member(session.user_id)
+        color_roles = session.context["colors"]
+        selected_color = session.answers["color"]
+        selected_hex = color_roles[selected_color]
+        color_role = self.bot.roles.get(guild, selected_color)
+        if not color_role:
+            color_role = await guild.create_role(name=selected_color, color=discord.Color.from_str(selected_hex))
+            self.bot.roles.add(color_role)
+
+        # Swap out old colour roles (and the legacy per-user role) in a single edit.
+        stale_names = set(color_roles)
+        stale_names.add(str(member.id))
+        roles = [role for role in member.roles if not role.is_default() and role.name not in stale_names]
+        roles.append(color_role)
+        if set(roles) != {role for role in member.roles if not role.is_default()}:
+            await member.edit(roles=roles)
+
+        await self.bot.storage.set_member_color(guild.id, member.id, selected_hex)
+
+        await self.bot.sender.send(channel, f"Color updated to {selected_color}! Hex code: {selected_hex}")
 
     @commands.command()
+    @commands.guild_only()
     async def playercard(self, ctx):
-        playercard_channel = bot_settings.get('channelIds', {}).get('playerCardChannel')
+        playercard_channel = guild_settings(ctx.guild.id).channel('playerCardChannel')
         if playercard_channel and ctx.channel.id != playercard_channel:
             await ctx.send("This command only works in the player card channel!")
             return
-        questions = [
-            "Pronouns?", "Zodiac?", "Languages?", "Time Zone?", "Country?", "Occupation?",
-            "Favorite Band Member?", "Discover Sleep Token?", "YouTube?", "Fun Facts?",
-            "Hobbies?", "Favorite Food?", "Favorite Games?", "Favorite Show?", "Discord Open?"
-        ]
-        answers = {}
-        for q in questions:
-            await ctx.author.send(q)
-            def check(m):
-                return m.author == ctx.author and m.channel == ctx.author.dm_channel
-            try:
-                msg = await self.bot.wait_for('message', check=check, timeout=300)
-                answers[q] = msg.content
-            except asyncio.TimeoutError:
-                await ctx.author.send("Timed out. Player card creation cancelled.")
-                return
-        card = (
-            f"**{ctx.author.display_name}'s Player Card**\n\n"
-            f"**Pronouns**\n{answers['Pronouns?']}\n"
-            f"**Zodiac**\n{answers['Zodiac?']}\n"
-            f"**Languages**\n{answers['Languages?']}\n"
-            f"**Time Zone**\n{answers['Time Zone?']}\n"
-            f"**Country**\n{answers['Country?']}\n"
-            f"**Occupation**\n{answers['Occupation?']}\n"
-            f"**Favorite Band Member**\n{answers['Favorite Band Member?']}\n"
-            f"**Discover Sleep Token**\n{answers['Discover Sleep Token?']}\n"
-            f"**YouTube**\n{answers['YouTube?']}\n"
-            f"**Fun Facts**\n{answers['Fun Facts?']}\n"
-            f"**Hobbies**\n{answers['Hobbies?']}\n"
-            f"**Favorite Food**\n{answers['Favorite Food?']}\n"
-            f"**Favorite Games**\n{answers['Favorite Games?']}\n"
-            f"**Favorite Show**\n{answers['Favorite Show?']}\n"
-            f"**Discord Open?**\n{answers['Discord Open?']}\n\n"
-            f"Player card created by {ctx.author.mention}"
+        dm = ctx.author.dm_channel or await ctx.author.create_dm()
+        context = {"guild_id": ctx.guild.id, "channel_id": ctx.channel.id, "display_name": ctx.author.display_name}
+        try:
+            await self.bot.forms.start("playercard", ctx.author.id, dm, context)
+        except discord.HTTPException:
+            await ctx.send(
+                f"{ctx.author.mention}, I couldn't DM you. Allow direct messages from server members and try again."
+            )
+
+    async def finish_playercard(self, session):
+        guild_id = session.context["guild_id"]
+        answers = session.answers
+        await self.bot.storage.set_playercard(guild_id, session.user_id, answers)
+        self.index.add(guild_id, session.user_id, answers)
+        card = render_card(session.context["display_name"], answers, f"<@{session.user_id}>")
+        playercard_channel = guild_settings(guild_id).channel('playerCardChannel')
+        channel = await self.bot.forms.channel(playercard_channel or session.context["channel_id"])
+        await self.bot.sender.send(channel, card)
+
+    @commands.command()
+    @commands.guild_only()
+    async def editcard(self, ctx, field: str, *, value: str):
+        field = FIELD_ALIASES.get(field.lower(), field.lower())
+        if field not in FIELD_NAMES:
+            await ctx.send(f"Unknown field. Fields: {', '.join(name for name, _, _ in FIELDS)}")
+            return
+        if self.index.get(ctx.guild.id, ctx.author.id) is None:
+            await ctx.send("You don't have a player card yet. Use !playercard to create one.")
+            return
+        await self.bot.storage.set_playercard_field(ctx.guild.id, ctx.author.id, field, value)
+        self.index.update(ctx.guild.id, ctx.author.id, field, value)
+        await ctx.send(f"Updated {field} on your player card.")
+
+    @commands.command()
+    @commands.guild_only()
+    async def findcard(self, ctx, *, query: str):
+        try:
+            terms = parse_query(query)
+        except ValueError as e:
+            await ctx.send(f"{e}. Fields: {', '.join(name for name, _, _ in FIELDS)}")
+            return
+        start = time.perf_counter()
+        matches = self.index.search(ctx.guild.id, terms)
+        elapsed = time.perf_counter() - start
+        if not matches:
+            await ctx.send("No player cards match.")
+            return
+        shown = sorted(matches)[:MAX_RESULTS]
+        more = f" (showing {MAX_RESULTS})" if len(matches) > MAX_RESULTS else ""
+        await ctx.send(
+            f"{len(matches)} player card{'s' if len(matches) != 1 else ''} matched{more}, found in {elapsed * 1e6:.0f}µs:\n"
+            + ", ".join(f"<@{user_id}>" for user_id in shown),
+            allowed_mentions=discord.AllowedMentions.none()
         )
-        config = load_json('data/config.json')
-        config[str(ctx.author.id)] = {"color": config.get(str(ctx.author.id), {}).get("color", "#FFFFFF"), "playercard": card}
-        save_json('data/config.json', config)
-        if playercard_channel:
-            channel = self.bot.get_channel(playercard_channel)
-            await channel.send(card)
-        else:
-            await ctx.send(card)
+
+def color_prompt(session):
+    color_options = "\n".join(f"{i+1}. {name}" for i, name in enumerate(session.context["colors"]))
+    return f"Choose a color:\n{color_options}\nOr type the color name (case-insensitive):"
+
+def parse_color(session, content):
+    colors_list = list(session.context["colors"])
+    user_input = content.lower()
+    if user_input.isdigit() and 0 < int(user_input) <= len(colors_list):
+        return colors_list[int(user_input) - 1]
+    selected_color = next((name for name in colors_list if name.lower() == user_input), None)
+    if selected_color is None:
+        raise ValueError("Invalid input or timeout. Color unchanged.")
+    return selected_color
 
 async def setup(bot):
     await bot.add_cog(PlayerCard(bot))
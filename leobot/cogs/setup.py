@@ -1,68 +1,86 @@
 import discord
 from discord.ext import commands
-import asyncio
-from ..utility.config_utils import bot_settings, save_bot_settings
+from ..utility.config_utils import guild_overrides, guild_settings, settings_service
+from ..utility.forms import FALLBACK, Form, Step
 
 BOT_OWNER_ID = 1131932116242939975
+INVALID = "Invalid input. Using current value."
+CHANNEL_PROMPTS = {
+    "playerCardChannel": "player card creation",
+    "triviaChannel": "trivia commands",
+    "modChannel": "mod-only commands"
+}
+
+def channel_step(key, purpose):
+    def prompt(session):
+        return f"Enter the channel ID for {purpose} (current: {session.context['current'][key]}):"
+
+    def parse(session, content):
+        if not content.isdigit():
+            raise ValueError(INVALID)
+        return int(content)
+
+    return Step(key, prompt, parse, invalid=FALLBACK, fallback=lambda session: session.context["current"][key])
+
+def admins_prompt(session):
+    return f"Enter admin IDs (comma-separated) (current: {', '.join(map(str, session.context['current']['admins']))}):"
+
+def parse_admins(session, content):
+    if not content:
+        return session.context["current"]["admins"]
+    try:
+        admin_ids = [int(id.strip()) for id in content.split(',') if id.strip()]
+    except ValueError:
+        raise ValueError(INVALID)
+    if BOT_OWNER_ID not in admin_ids:
+        admin_ids.append(BOT_OWNER_ID)
+    return admin_ids
 
 class Setup(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        steps = [channel_step(key, purpose) for key, purpose in CHANNEL_PROMPTS.items()]
+        steps.append(Step(
+            "admins", admins_prompt, parse_admins,
+            invalid=FALLBACK,
+            fallback=lambda session: session.context["current"]["admins"]
+        ))
+        bot.forms.register(Form(
+            "setup",
+            steps,
+            self.finish_setup,
+            timeout=60,
+            timeout_message="Setup timed out. Settings unchanged."
+        ))
+
+    def cog_unload(self):
+        self.bot.forms.unregister("setup")
 
     @commands.command()
+    @commands.guild_only()
     async def setupleobot(self, ctx):
         if ctx.author.id != BOT_OWNER_ID:
             await ctx.send("Only the bot owner can run this command.")
             return
-        current_playercard = bot_settings.get("channelIds", {}).get("playerCardChannel", "None")
-        await ctx.send(f"Enter the channel ID for player card creation (current: {current_playercard}):")
-        def check(m):
-            return m.author == ctx.author and m.channel == ctx.channel
-        try:
-            msg = await self.bot.wait_for('message', check=check, timeout=60)
-            playercard_channel = int(msg.content)
-        except (ValueError, asyncio.TimeoutError):
-            await ctx.send("Invalid input or timeout. Using current value.")
-            playercard_channel = current_playercard if current_playercard != "None" else None
-        current_trivia = bot_settings.get("channelIds", {}).get("triviaChannel", "None")
-        await ctx.send(f"Enter the channel ID for trivia commands (current: {current_trivia}):")
-        try:
-            msg = await self.bot.wait_for('message', check=check, timeout=60)
-            trivia_channel = int(msg.content)
-        except (ValueError, asyncio.TimeoutError):
-            await ctx.send("Invalid input or timeout. Using current value.")
-            trivia_channel = current_trivia if current_trivia != "None" else None
-        current_mod = bot_settings.get("channelIds", {}).get("modChannel", "None")
-        await ctx.send(f"Enter the channel ID for mod-only commands (current: {current_mod}):")
-        try:
-            msg = await self.bot.wait_for('message', check=check, timeout=60)
-            mod_channel = int(msg.content)
-        except (ValueError, asyncio.TimeoutError):
-            await ctx.send("Invalid input or timeout. Using current value.")
-            mod_channel = current_mod if current_mod != "None" else None
-        current_admins = bot_settings.get("admins", [BOT_OWNER_ID])
-        await ctx.send(f"Enter admin IDs (comma-separated) (current: {', '.join(map(str, current_admins))}):")
-        try:
-            msg = await self.bot.wait_for('message', check=check, timeout=60)
-            admin_ids_input = msg.content.strip()
-            if admin_ids_input:
-                admin_ids = [int(id.strip()) for id in admin_ids_input.split(',') if id.strip()]
-                if BOT_OWNER_ID not in admin_ids:
-                    admin_ids.append(BOT_OWNER_ID)
-            else:
-                admin_ids = current_admins
-        except (ValueError, asyncio.TimeoutError):
-            await ctx.send("Invalid input or timeout. Using current value.")
-            admin_ids = current_admins
-        bot_settings.setdefault("channelIds", {})
-        bot_settings["channelIds"]["playerCardChannel"] = playercard_channel
-        bot_settings["channelIds"]["triviaChannel"] = trivia_channel
-        bot_settings["channelIds"]["modChannel"] = mod_channel
-        bot_settings["admins"] = admin_ids
-        save_bot_settings(bot_settings)
-        await ctx.send("Setup complete!")
+        settings = guild_settings(ctx.guild.id)
+        current = {key: settings.channel(key) for key in CHANNEL_PROMPTS}
+        # The guild's own list; botAdmins are added on top when settings load.
+        overrides = settings_service.data.get("guilds", {}).get(str(ctx.guild.id), {})
+        current["admins"] = list(overrides.get("admins", [BOT_OWNER_ID]))
+        await self.bot.forms.start("setup", ctx.author.id, ctx.channel, {"guild_id": ctx.guild.id, "current": current})
+
+    async def finish_setup(self, session):
+        data = settings_service.copy()
+        overrides = guild_overrides(data, session.context["guild_id"])
+        overrides.setdefault("channelIds", {})
+        for key in CHANNEL_PROMPTS:
+            overrides["channelIds"][key] = session.answers[key]
+        overrides["admins"] = session.answers["admins"]
+        settings_service.save(data)
+        await self.bot.sender.send(await self.bot.forms.channel(session.channel_id), "Setup complete!")
 
     @commands.command()
+    @commands.guild_only()
     async def setadmin(self, ctx, admin_ids: str):
         if ctx.author.id != BOT_OWNER_ID:
             await ctx.send("Only the bot owner can run this command.")
@@ -70,38 +88,42 @@ class Setup(commands.Cog):
         admin_ids_list = [int(id.strip()) for id in admin_ids.split(',') if id.strip()]
         if BOT_OWNER_ID not in admin_ids_list:
             admin_ids_list.append(BOT_OWNER_ID)
-        bot_settings["admins"] = admin_ids_list
-        save_bot_settings(bot_settings)
+        data = settings_service.copy()
+        guild_overrides(data, ctx.guild.id)["admins"] = admin_ids_list
+        settings_service.save(data)
         await ctx.send("Admins updated successfully.")
 
     @commands.command()
+    @commands.guild_only()
     async def setplayercardchannel(self, ctx, channel_id: int):
         if ctx.author.id != BOT_OWNER_ID:
             await ctx.send("Only the bot owner can run this command.")
             return
-        bot_settings.setdefault("channelIds", {})
-        bot_settings["channelIds"]["playerCardChannel"] = channel_id
-        save_bot_settings(bot_settings)
+        data = settings_service.copy()
+        guild_overrides(data, ctx.guild.id).setdefault("channelIds", {})["playerCardChannel"] = channel_id
+        settings_service.save(data)
         await ctx.send("Player card channel updated successfully.")
 
     @commands.command()
+    @commands.guild_only()
     async def settriviachannel(self, ctx, channel_id: int):
         if ctx.author.id != BOT_OWNER_ID:
             await ctx.send("Only the bot owner can run this command.")
             return
-        bot_settings.setdefault("channelIds", {})
-        bot_settings["channelIds"]["triviaChannel"] = channel_id
-        save_bot_settings(bot_settings)
+        data = settings_service.copy()
+        guild_overrides(data, ctx.guild.id).setdefault("channelIds", {})["triviaChannel"] = channel_id
+        settings_service.save(data)
         await ctx.send("Trivia channel updated successfully.")
 
     @commands.command()
+    @commands.guild_only()
     async def setmodchannel(self, ctx, channel_id: int):
         if ctx.author.id != BOT_OWNER_ID:
             await ctx.send("Only the bot owner can run this command.")
             return
-        bot_settings.setdefault("channelIds", {})
-        bot_settings["channelIds"]["modChannel"] = channel_id
-        save_bot_settings(bot_settings)
+        data = settings_service.copy()
+        guild_overrides(data, ctx.guild.id).setdefault("channelIds", {})["modChannel"] = channel_id
+        settings_service.save(data)
         await ctx.send("Mod-only channel updated successfully.")
 
 async def setup(bot):
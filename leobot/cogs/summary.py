@@ -1,47 +1,113 @@
 import discord
 from discord.ext import commands
 import aiohttp
-from datetime import datetime, timedelta
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
+from ..utility.config_utils import settings_service
+from ..utility.message_buffer import MessageBuffer
+from ..utility.summarizer import MapReduceSummarizer
 
 load_dotenv()
 GROK3_API_KEY = os.getenv('GROK3_API_KEY')
 
+PROGRESS_INTERVAL = 2.0  # Minimum seconds between progress message edits
+
 class Summary(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        settings = settings_service.data.get('summary', {})
+        self.chunk_tokens = settings.get('chunkTokens', 3000)
+        self.concurrency = settings.get('concurrency', 4)
+        self.max_input_tokens = settings.get('maxInputTokens', 60000)
+        self.buffer = MessageBuffer(
+            max_messages=settings.get('bufferMessages', 5000),
+            max_channels=settings.get('bufferChannels', 200),
+            max_age=settings.get('bufferMaxAge', 86400)
+        )
+        bot.router.register("message", "summary.buffer", self.record_message)
+
+    def cog_unload(self):
+        self.bot.router.unregister("summary.buffer")
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.buffer.mark_gap()
+
+    async def record_message(self, message):
+        if not message.content:
+            return
+        self.buffer.add(message.channel.id, message.author.id, message.created_at.timestamp(), message.content)
+
+    async def complete(self, prompt):
+        session = self.bot.http_pool.session
+        async with session.post(
+            "https://api.xai.com/grok3",  # Hypothetical endpoint
+            headers={"Authorization": f"Bearer {GROK3_API_KEY}"},
+            json={
+                "model": "grok3",
+                "messages": [{"role": "user", "content": prompt}]
+            }
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+            return data.get('choices', [{}])[0].get('message', {}).get('content', 'No summary available.')
+
+    async def history_lines(self, channel, start_time):
+        # Serve from the gateway buffer where it covers the window and only
+        # page through REST history for the part before it.
+        start = start_time.timestamp()
+        covered_since = self.buffer.covered_since(channel.id)
+        records = self.buffer.records_after(channel.id, start)
+        if covered_since > start:
+            before = datetime.fromtimestamp(covered_since, tz=timezone.utc)
+            async for msg in channel.history(limit=None, after=start_time, before=before, oldest_first=True):
+                if not msg.author.bot and msg.content:
+                    yield msg.content
+        for record in records:
+            yield record.content
 
     @commands.command()
     async def summary(self, ctx, minutes: int):
         if minutes <= 0:
             await ctx.send("Please specify a positive number of minutes.")
             return
-        end_time = datetime.utcnow()
+        end_time = discord.utils.utcnow()
         start_time = end_time - timedelta(minutes=minutes)
-        messages = []
-        async for msg in ctx.channel.history(limit=100, after=start_time):
-            if not msg.author.bot:
-                messages.append(msg.content)
-        if not messages:
+        summarizer = MapReduceSummarizer(
+            self.complete,
+            chunk_tokens=self.chunk_tokens,
+            concurrency=self.concurrency,
+            max_input_tokens=self.max_input_tokens
+        )
+        status = None
+        last_edit = 0.0
+
+        async def on_progress(done, total):
+            nonlocal status, last_edit
+            now = time.monotonic()
+            if now - last_edit < PROGRESS_INTERVAL and done < total:
+                return
+            last_edit = now
+            text = f"Summarizing... {done}/{total} parts done."
+            if status is None:
+                status = await ctx.send(text)
+            else:
+                await status.edit(content=text)
+
+        try:
+            summary = await summarizer.summarize(self.history_lines(ctx.channel, start_time), on_progress)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Summary error: {e}")
+            await ctx.send("Failed to generate summary. Try again later.")
+            return
+        if summary is None:
             await ctx.send("No messages found in the specified time frame.")
             return
-        prompt = "Summarize the following conversation briefly, focusing on hot topics discussed. Do not list user names:\n" + "\n".join(messages)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.xai.com/grok3",  # Hypothetical endpoint
-                headers={"Authorization": f"Bearer {GROK3_API_KEY}"},
-                json={
-                    "model": "grok3",
-                    "messages": [{"role": "user", "content": prompt}]
-                }
-            ) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    summary = data.get('choices', [{}])[0].get('message', {}).get('content', 'No summary available.')
-                    await ctx.send(f"Summary of the last {minutes} minutes:\n{summary}")
-                else:
-                    await ctx.send("Failed to generate summary. Try again later.")
+        note = "\n(Only the earliest part of this window fit within the summary budget.)" if summarizer.truncated else ""
+        await ctx.send(f"Summary of the last {minutes} minutes:\n{summary}{note}")
 
 async def setup(bot):
     await bot.add_cog(Summary(bot))
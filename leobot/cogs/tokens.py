@@ -1,33 +1,47 @@
 import discord
 from discord.ext import commands
-from ..utility.config_utils import bot_settings
 from ..utility.permission_utils import is_mod
-from ..utility.utility_functions import load_json, save_json
 
 class TokenManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.tokens = load_json('data/tokens.json')
 
     @commands.command()
+    @commands.guild_only()
     async def givetokens(self, ctx, member: discord.Member, amount: int):
         if not is_mod(ctx.author):
             await ctx.send("Only mods can use this command.")
             return
-        user_id = str(member.id)
-        self.tokens[user_id] = self.tokens.get(user_id, 0) + amount
-        save_json('data/tokens.json', self.tokens)
-        await ctx.send(f"Gave {amount} sleep tokens to {member.mention}. They now have {self.tokens[user_id]} tokens.")
+        balances = await self.bot.ledger.post(ctx.guild.id, {member.id: amount}, f"givetokens by {ctx.author.id}")
+        balance = balances.get(member.id, self.bot.ledger.balance(ctx.guild.id, member.id))
+        await ctx.send(f"Gave {amount} sleep tokens to {member.mention}. They now have {balance} tokens.")
 
     @commands.command()
+    @commands.guild_only()
     async def tokens(self, ctx):
-        user_id = str(ctx.author.id)
-        amount = self.tokens.get(user_id, 0)
+        amount = self.bot.ledger.balance(ctx.guild.id, ctx.author.id)
         await ctx.send(f"You have {amount} sleep tokens.")
 
-    def add_tokens(self, user_id, amount):
-        self.tokens[str(user_id)] = self.tokens.get(str(user_id), 0) + amount
-        save_json('data/tokens.json', self.tokens)
+    @commands.command()
+    @commands.guild_only()
+    async def tokenhistory(self, ctx, member: discord.Member = None):
+        if member is not None and member != ctx.author and not is_mod(ctx.author):
+            await ctx.send("Only mods can view other members' token history.")
+            return
+        member = member or ctx.author
+        entries = await self.bot.ledger.history(ctx.guild.id, member.id)
+        if not entries:
+            await ctx.send(f"No sleep token history for {member.display_name}.")
+            return
+        lines = [f"- <t:{created_at}:d> {amount:+d} ({reason})" for amount, reason, created_at in entries]
+        await ctx.send(
+            f"Sleep token history for {member.display_name} (balance {self.bot.ledger.balance(ctx.guild.id, member.id)}):\n"
+            + "\n".join(lines)
+        )
+
+    async def add_tokens(self, guild_id, amounts, reason):
+        # One ledger transaction for the whole batch, e.g. a trivia game's payouts.
+        return await self.bot.ledger.post(guild_id, amounts, reason)
 
 async def setup(bot):
     await bot.add_cog(TokenManager(bot))
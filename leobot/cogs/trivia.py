@@ -4,16 +4,75 @@ from discord.ext import commands
 import asyncio
 import os
 import random
-import aiohttp
-from html import unescape
-from ..utility.utility_functions import load_json, save_json
+import time
+from ..utility.leaderboard import ALL_TIME, LeaderboardIndex, category_board, season_board
+from ..utility.metrics import metrics
+from ..utility.send_scheduler import BULK, INTERACTIVE
+from ..utility.trivia_questions import QuestionPool
 import asyncio
 
+class TriviaGame:
+    # Everything one channel's game needs, so games in different channels
+    # never share state or timers.
+    __slots__ = (
+        "channel", "sender", "category", "difficulty", "questions", "index",
+        "message", "guesses", "scores", "timer_task", "question_calls", "rest_calls"
+    )
+
+    def __init__(self, channel, sender):
+        self.channel = channel
+        self.sender = sender
+        self.category = None
+        self.difficulty = None
+        self.questions = []
+        self.index = 0
+        self.message = None
+        self.guesses = {}  # user_id: (letter, monotonic vote time) for the current question
+        self.scores = {}  # user_id: correct answers this game
+        self.timer_task = None
+        self.question_calls = 0  # Sends requested for the current question
+        self.rest_calls = []  # Sends requested per finished question
+
+    @property
+    def active(self):
+        return bool(self.questions)
+
+    def send(self, content, priority=INTERACTIVE, **kwargs):
+        # Returns a future for the sent message. Game messages are mergeable,
+        # so a result queued right before the next question goes out with it.
+        self.question_calls += 1
+        return self.sender.submit(self.channel, content, priority=priority, merge=True, **kwargs)
+
+class AnswerView(discord.ui.View):
+    # Votes arrive as button interactions. Each one is acknowledged with an
+    # ephemeral interaction response and recorded locally, so collecting
+    # answers costs no channel REST calls however many people vote.
+    def __init__(self, game, option_count):
+        super().__init__(timeout=None)
+        self.game = game
+        self.closed = False
+        for i in range(option_count):
+            button = discord.ui.Button(label=chr(65 + i), style=discord.ButtonStyle.primary)
+            button.callback = self.make_callback(chr(65 + i))
+            self.add_item(button)
+
+    def make_callback(self, letter):
+        async def callback(interaction):
+            if self.closed:
+                await interaction.response.send_message("This question is closed.", ephemeral=True)
+                return
+            self.game.guesses[interaction.user.id] = (letter, time.monotonic())
+            await interaction.response.send_message(f"Answer {letter} locked in!", ephemeral=True)
+        return callback
+
+    def close(self):
+        self.closed = True
+        self.stop()
+
 class Trivia(commands.Cog):
     TRIVIA_CHANNEL_ID = None
     TIMER_DURATION = 25  # Seconds per question
-    LEADERBOARD_FILE = "data/trivia_leaderboard.json"
-    ROUNDS_FILE = "data/trivia_rounds.json"
+    BOARD_SIZE = 10
     CATEGORY_POOL = [
         "General Knowledge", "Science", "History", "Geography", "Sports",
         "Entertainment", "Literature", "Technology", "Art", "Mathematics"
@@ -38,84 +97,38 @@ class Trivia(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.is_trivia_active = False
-        self.current_question_index = 0
-        self.current_question_message = None
-        self.timer_task = None
-        self.selected_category = None
-        self.selected_difficulty = None
         self.question_count = 10
-        self.current_questions = []
-        self.game_scores = {}
-        self.current_guesses = {}
-        self.all_time_leaderboard = load_json(self.LEADERBOARD_FILE)
-        rounds_data = load_json(self.ROUNDS_FILE)
-        self.rounds = rounds_data.get("rounds", 0) if rounds_data else 0
-        self.session_token = None
-        asyncio.create_task(self.fetch_session_token())
-
-    async def fetch_session_token(self):
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get("[invalid url, do not cite]", timeout=5) as resp:
-                    if resp.status != 200:
-                        return None
-                    data = await resp.json()
-                    if data["response_code"] == 0:
-                        self.session_token = data["token"]
-                        return self.session_token
-                    return None
-        except aiohttp.ClientError:
-            return None
-
-    async def fetch_questions(self, category, difficulty):
-        category_id = self.CATEGORY_MAP.get(category)
-        difficulty_level = self.DIFFICULTY_MAP.get(difficulty)
-        if not category_id or not difficulty_level:
-            return []
-        url = f"[invalid url, do not cite]"
-        if self.session_token:
-            url += f"&token={self.session_token}"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as resp:
-                    if resp.status != 200:
-                        return []
-                    data = await resp.json()
-                    if data["response_code"] != 0:
-                        if data["response_code"] in [3, 4]:
-                            self.session_token = await self.fetch_session_token()
-                            url = f"[invalid url, do not cite]"
-                            async with session.get(url, timeout=5) as resp2:
-                                if resp2.status != 200:
-                                    return []
-                                data = await resp2.json()
-                                if data["response_code"] != 0:
-                                    return []
-                        else:
-                            return []
-                    questions = []
-                    for q in data["results"]:
-                        question_text = unescape(q["question"])
-                        correct_answer = unescape(q["correct_answer"])
-                        incorrect_answers = [unescape(ans) for ans in q["incorrect_answers"]]
-                        options = incorrect_answers + [correct_answer]
-                        random.shuffle(options)
-                        answer_idx = options.index(correct_answer)
-                        questions.append({
-                            "category": category,
-                            "difficulty": difficulty,
-                            "question": question_text,
-                            "options": options,
-                            "answer": answer_idx
-                        })
-                    return questions
-        except aiohttp.ClientError:
-            return []
+        self.games = {}  # channel_id: TriviaGame
+        self.boards = LeaderboardIndex()
+        metrics.gauge("leobot_trivia_games", "Trivia games in progress.", lambda: len(self.games))
+        self.pool = QuestionPool(bot.http_pool, self.CATEGORY_MAP, self.DIFFICULTY_MAP, target=self.question_count)
+        self.fill_task = asyncio.create_task(self.pool.fill_all())
+
+    async def cog_load(self):
+        await self.load_boards()
+
+    async def load_boards(self):
+        boards = LeaderboardIndex()
+        boards.load(await self.bot.storage.all_scores())
+        self.boards = boards
+
+    @commands.Cog.listener()
+    async def on_legacy_adopted(self, guild_id):
+        await self.load_boards()
+
+    def current_season(self, guild_id):
+        from ..utility.config_utils import guild_settings
+        return season_board(guild_settings(guild_id).get('trivia', {}).get('season'))
+
+    def cog_unload(self):
+        metrics.remove_gauge("leobot_trivia_games")
+        for game in self.games.values():
+            if game.timer_task:
+                game.timer_task.cancel()
 
     async def check_trivia_channel(self, ctx):
-        from ..utility.config_utils import bot_settings
-        trivia_channel = bot_settings.get('channelIds', {}).get('triviaChannel')
+        from ..utility.config_utils import guild_settings
+        trivia_channel = guild_settings(ctx.guild.id).channel('triviaChannel')
         if trivia_channel and ctx.channel.id != trivia_channel:
             await ctx.send(f"Trivia commands are only allowed in <#{trivia_channel}>!")
             return False
@@ -146,110 +159,169 @@ class Trivia(commands.Cog):
         return options[{'🇦': 0, '🇧': 1, '🇨': 2}[winning_emoji]]
 
     @commands.command()
+    @commands.guild_only()
     async def trivia(self, ctx):
         from ..utility.permission_utils import is_mod
         if not await self.check_trivia_channel(ctx) or not is_mod(ctx.author):
             return
-        if self.is_trivia_active:
-            await ctx.send("A trivia game is already in progress!")
+        if ctx.channel.id in self.games:
+            await ctx.send("A trivia game is already in progress in this channel!")
             return
-        categories = random.sample(self.CATEGORY_POOL, 3)
-        self.selected_category = await self.run_poll(
-            ctx, "Choose a category:", categories
-        )
-        await ctx.send(f"Selected category: **{self.selected_category}**")
-        difficulties = ["Easy", "Medium", "Hard"]
-        self.selected_difficulty = await self.run_poll(
-            ctx, "Choose the difficulty:", difficulties
-        )
-        await ctx.send(f"Selected difficulty: **{self.selected_difficulty}**")
-        self.is_trivia_active = True
-        questions = await self.fetch_questions(self.selected_category, self.selected_difficulty)
-        if questions:
-            self.current_questions = questions[:10]
-            self.current_question_index = 0
-            await self.send_question(ctx.channel)
+        game = TriviaGame(ctx.channel, self.bot.sender)
+        self.games[ctx.channel.id] = game
+        try:
+            categories = random.sample(self.CATEGORY_POOL, 3)
+            self.pool.warm(categories)
+            game.category = await self.run_poll(
+                ctx, "Choose a category:", categories
+            )
+            await ctx.send(f"Selected category: **{game.category}**")
+            difficulties = ["Easy", "Medium", "Hard"]
+            game.difficulty = await self.run_poll(
+                ctx, "Choose the difficulty:", difficulties
+            )
+            await ctx.send(f"Selected difficulty: **{game.difficulty}**")
+            game.questions = await self.pool.take(game.category, game.difficulty, self.question_count)
+        finally:
+            if not game.active:
+                del self.games[ctx.channel.id]
+        if game.active:
+            try:
+                await self.send_question(game)
+            except Exception:
+                self.drop_game(game)
+                raise
         else:
-            self.is_trivia_active = False
             await ctx.send("Unable to fetch questions. Try again later.")
 
-    async def send_question(self, channel):
-        if self.current_question_index >= len(self.current_questions):
-            await self.end_game(channel)
+    async def send_question(self, game):
+        if game.index >= len(game.questions):
+            await self.end_game(game)
             return
-        question_data = self.current_questions[self.current_question_index]
+        question_data = game.questions[game.index]
         answer_text = "\n".join([f"{chr(65 + i)}: {opt}" for i, opt in enumerate(question_data["options"])])
-        self.current_question_message = await channel.send(
-            f"Question {self.current_question_index + 1}/{len(self.current_questions)}: {question_data['question']}\n\n{answer_text}\n\n"
-            f"React with 🇦, 🇧, 🇨, or 🇩! Time: {self.TIMER_DURATION} seconds."
+        game.guesses = {}
+        view = AnswerView(game, len(question_data["options"]))
+        game.question_calls = 0
+        game.message = await game.send(
+            f"Question {game.index + 1}/{len(game.questions)}: {question_data['question']}\n\n{answer_text}\n\n"
+            f"Pick your answer below! Time: {self.TIMER_DURATION} seconds.",
+            view=view
         )
-        for emoji in ['🇦', '🇧', '🇨', '🇩']:
-            await self.current_question_message.add_reaction(emoji)
-        self.current_guesses[self.current_question_index] = {}
-        self.timer_task = asyncio.create_task(self.timer(channel, question_data))
-
-    async def timer(self, channel, question_data):
-        await asyncio.sleep(self.TIMER_DURATION)
-        guesses = self.current_guesses.get(self.current_question_index, {})
-        correct_answer = question_data["options"][question_data["answer"]]
-        correct_letter = chr(65 + question_data["answer"])
-        correct_users = []
-        for user_id, guess in guesses.items():
-            if guess == correct_letter:
-                self.game_scores[user_id] = self.game_scores.get(user_id, 0) + 1
-                user = self.bot.get_user(user_id)
-                if user:
-                    correct_users.append(user.mention)
-        result = f"Time’s up! Correct answer: {correct_answer} (Option {correct_letter})\n"
-        if correct_users:
-            result += f"Correct: {', '.join(correct_users)}"
-        else:
-            result += "No one got it right!"
-        await channel.send(result)
-        self.current_question_index += 1
-        await self.send_question(channel)
-
-    async def end_game(self, channel):
-        for user_id, score in self.game_scores.items():
-            self.all_time_leaderboard[str(user_id)] = self.all_time_leaderboard.get(str(user_id), 0) + score
-        save_json(self.LEADERBOARD_FILE, self.all_time_leaderboard)
-        self.rounds += 1
-        save_json(self.ROUNDS_FILE, {"rounds": self.rounds})
-        game_leaderboard = sorted(self.game_scores.items(), key=lambda x: x[1], reverse=True)
+        game.timer_task = asyncio.create_task(self.timer(game, question_data, view))
+
+    async def timer(self, game, question_data, view):
+        # Each question's timer task runs the rest of the game; if it dies,
+        # free the channel rather than leave a game nobody can finish.
+        try:
+            await asyncio.sleep(self.TIMER_DURATION)
+            view.close()
+            guesses = game.guesses
+            correct_answer = question_data["options"][question_data["answer"]]
+            correct_letter = chr(65 + question_data["answer"])
+            correct_users = []
+            for user_id, (guess, voted_at) in guesses.items():
+                if guess == correct_letter:
+                    game.scores[user_id] = game.scores.get(user_id, 0) + 1
+                    correct_users.append(f"<@{user_id}>")
+            result = f"Time’s up! Correct answer: {correct_answer} (Option {correct_letter})\n"
+            if correct_users:
+                result += f"Correct: {', '.join(correct_users)}"
+            else:
+                result += "No one got it right!"
+            game.send(result)
+            game.rest_calls.append(game.question_calls)
+            game.index += 1
+            await self.send_question(game)
+        except Exception as e:
+            print(f"Trivia game in {game.channel.id} aborted: {e}")
+            self.drop_game(game)
+
+    def drop_game(self, game):
+        if self.games.get(game.channel.id) is game:
+            del self.games[game.channel.id]
+
+    async def end_game(self, game):
+        storage = self.bot.storage
+        guild_id = game.channel.guild.id
+        if game.scores:
+            boards = [category_board(game.category), self.current_season(guild_id)]
+            await storage.add_scores(guild_id, game.scores, boards)
+            self.boards.add(guild_id, [ALL_TIME] + boards, game.scores)
+        await storage.increment_counter(guild_id, "trivia_rounds")
+        game_leaderboard = sorted(game.scores.items(), key=lambda x: x[1], reverse=True)
         game_text = "Game Leaderboard:\n" + "\n".join(
-            [f"{self.bot.get_user(user_id).mention}: {score}" for user_id, score in game_leaderboard]
+            [f"<@{user_id}>: {score}" for user_id, score in game_leaderboard]
         ) if game_leaderboard else "No scores this game."
-        all_time_leaderboard = sorted(self.all_time_leaderboard.items(), key=lambda x: x[1], reverse=True)[:5]
+        all_time_leaderboard = self.boards.board(guild_id, ALL_TIME).top(5)
         all_time_text = "All-Time Leaderboard (Top 5):\n" + "\n".join(
-            [f"{self.bot.get_user(int(user_id)).mention}: {score}" for user_id, score in all_time_leaderboard]
+            [f"<@{user_id}>: {score}" for user_id, score in all_time_leaderboard]
         ) if all_time_leaderboard else "No scores yet."
         token_cog = self.bot.get_cog("TokenManager")
         token_text = ""
         if token_cog:
-            for user_id, score in self.game_scores.items():
-                if score > 0:
-                    token_cog.add_tokens(user_id, score)
-                    user = self.bot.get_user(user_id)
-                    if user:
-                        token_text += f"Awarded {score} Sleep Token{'s' if score > 1 else ''} to {user.mention}!\n"
-        await channel.send(f"Trivia ended!\n\n{game_text}\n\n{all_time_text}" + (f"\n\n{token_text}" if token_text else ""))
-        self.is_trivia_active = False
-        self.game_scores = {}
-        self.current_guesses = {}
-        self.selected_category = None
-        self.selected_difficulty = None
-        self.current_question_message = None
-        self.current_questions = []
+            payouts = {user_id: score for user_id, score in game.scores.items() if score > 0}
+            if payouts:
+                await token_cog.add_tokens(guild_id, payouts, "trivia")
+            for user_id, score in payouts.items():
+                token_text += f"Awarded {score} Sleep Token{'s' if score > 1 else ''} to <@{user_id}>!\n"
+        await game.send(
+            f"Trivia ended!\n\n{game_text}\n\n{all_time_text}" + (f"\n\n{token_text}" if token_text else ""),
+            priority=BULK
+        )
+        self.drop_game(game)
+        if game.rest_calls:
+            print(f"Trivia in {game.channel.id}: {sum(game.rest_calls)} sends requested over {len(game.rest_calls)} questions (max {max(game.rest_calls)} per question, results merged into the next question)")
 
-    @commands.Cog.listener()
-    async def on_reaction_add(self, reaction, user):
-        if user == self.bot.user or not self.is_trivia_active or reaction.message != self.current_question_message:
+    @commands.command()
+    @commands.guild_only()
+    async def rank(self, ctx, member: discord.Member = None):
+        member = member or ctx.author
+        boards = self.boards.guild_boards(ctx.guild.id)
+        season = self.current_season(ctx.guild.id)
+        lines = []
+        for board, leaderboard in sorted(boards.items(), key=lambda item: board_order(item[0], season)):
+            if board.startswith("season:") and board != season:
+                continue
+            entry = leaderboard.rank(member.id)
+            if entry:
+                lines.append(f"- {board_title(board)}: #{entry[0]} of {len(leaderboard)} ({entry[1]} points)")
+        if not lines:
+            await ctx.send(f"{member.display_name} hasn't scored in trivia yet.")
             return
-        if reaction.emoji not in ['🇦', '🇧', '🇨', '🇩']:
+        await ctx.send(f"Trivia ranks for {member.display_name}:\n" + "\n".join(lines))
+
+    @commands.command()
+    @commands.guild_only()
+    async def leaderboard(self, ctx, *, board: str = None):
+        # No argument: all-time. "season" or a season name, or a category name.
+        name = (board or "").strip()
+        if not name:
+            key = ALL_TIME
+        elif name.lower() == "season":
+            key = self.current_season(ctx.guild.id)
+        else:
+            category = next((c for c in self.CATEGORY_POOL if c.lower() == name.lower()), None)
+            key = category_board(category) if category else season_board(name)
+        entries = self.boards.guild_boards(ctx.guild.id).get(key)
+        if not entries:
+            await ctx.send(f"No scores on the {board_title(key)} board yet.")
             return
-        letter = {'🇦': 'A', '🇧': 'B', '🇨': 'C', '🇩': 'D'}[reaction.emoji]
-        self.current_guesses[self.current_question_index][user.id] = letter
-        await reaction.remove(user)
+        lines = [f"{i + 1}. <@{user_id}>: {score}" for i, (user_id, score) in enumerate(entries.top(self.BOARD_SIZE))]
+        await ctx.send(
+            f"{board_title(key)} Leaderboard (Top {self.BOARD_SIZE}):\n" + "\n".join(lines),
+            allowed_mentions=discord.AllowedMentions.none()
+        )
+
+def board_title(board):
+    if board == ALL_TIME:
+        return "All-Time"
+    kind, _, name = board.partition(":")
+    return f"Season {name}" if kind == "season" else name
+
+def board_order(board, season):
+    # All-time first, then the current season, then categories by name.
+    return (board != ALL_TIME, board != season, board)
 
 async def setup(bot):
     await bot.add_cog(Trivia(bot))
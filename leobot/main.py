@@ -1,18 +1,119 @@
 import discord
 from discord.ext import commands
+import asyncio
 import os
 from dotenv import load_dotenv
-from .utility.config_utils import bot_settings, save_bot_settings
+from .utility.config_utils import guild_settings, settings_service
+from .utility.forms import FormManager
+from .utility.llm_client import LLMClients
+from .utility.message_router import MessageRouter
+from .utility.metrics import LoopLagMonitor, MetricsServer, metrics
+from .utility.http_session import HTTPSessionManager
+from .utility.persistence import flush_all
+from .utility.role_index import RoleIndex
+from .utility.scheduler import DeadlineScheduler
+from .utility.send_scheduler import SendScheduler
+from .utility.storage import Storage
+from .utility.token_ledger import TokenLedger
 
 # Load environment variables
 load_dotenv()
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
+# Sharding: leave both unset to let Discord pick the shard count and run every
+# shard in this process. To split shards across processes, give each process
+# the same SHARD_COUNT and its own comma-separated SHARD_IDS.
+SHARD_COUNT = os.getenv('SHARD_COUNT')
+SHARD_IDS = os.getenv('SHARD_IDS')
 
 # Bot setup
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+
+def shard_options():
+    settings = settings_service.data.get('sharding', {})
+    shard_count = int(SHARD_COUNT) if SHARD_COUNT else settings.get('shardCount')
+    shard_ids = [int(i) for i in SHARD_IDS.split(',')] if SHARD_IDS else settings.get('shardIds')
+    if shard_ids is not None and shard_count is None:
+        raise ValueError("SHARD_IDS needs SHARD_COUNT to be set as well")
+    return {'shard_count': shard_count, 'shard_ids': shard_ids}
+
+class LeoBot(commands.AutoShardedBot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.guild_setup = asyncio.Semaphore(settings_service.data.get('sharding', {}).get('guildSetupConcurrency', 8))
+        self.llm = LLMClients()
+        self.http_pool = HTTPSessionManager()
+        self.storage = Storage()
+        self.ledger = TokenLedger(self.storage)
+        self.scheduler = DeadlineScheduler()
+        self.router = MessageRouter(self)
+        self.forms = FormManager(self)
+        self.sender = SendScheduler()
+        self.roles = RoleIndex()
+        self.loop_lag = LoopLagMonitor(metrics)
+        metrics_settings = settings_service.data.get('metrics', {})
+        port = metrics_settings.get('port', 9108)
+        self.metrics_server = MetricsServer(metrics, metrics_settings.get('host', '127.0.0.1'), port) if port else None
+        metrics.gauge(
+            "leobot_pending_sends", "Channel messages queued in the send scheduler.",
+            lambda: sum(len(state.heap) for state in self.sender.queues.values())
+        )
+        metrics.gauge("leobot_scheduled_deadlines", "Deadlines waiting in the scheduler.", lambda: len(self.scheduler))
+        metrics.gauge("leobot_open_forms", "Form sessions in progress.", lambda: len(self.forms.sessions))
+        metrics.gauge("leobot_event_loop_lag_last_seconds", "Most recent event loop lag sample.", lambda: self.loop_lag.last)
+        metrics.gauge("leobot_guilds", "Guilds the bot is in.", lambda: len(self.guilds))
+
+    async def setup_hook(self):
+        # Runs once per login, unlike on_ready which repeats on reconnects.
+        self.scheduler.start()
+        settings_service.start()
+        await self.ledger.load()
+        self.loop_lag.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+
+    async def prepare_guild(self, guild):
+        # Per-guild startup work; guilds are prepared concurrently, a few at a time.
+        async with self.guild_setup:
+            # The role cache may be stale after a reconnect; rebuild it from the fresh guild.
+            self.roles.build(guild)
+            await self.roles.ensure(guild, guild_settings(guild.id).color_roles)
+
+    async def on_message(self, message):
+        await self.router.route(message)
+
+    async def on_command_error(self, context, exception):
+        if context.command is not None:
+            metrics.inc("leobot_command_errors_total", command=context.command.qualified_name)
+        await super().on_command_error(context, exception)
+
+    async def on_guild_role_create(self, role):
+        self.roles.add(role)
+
+    async def on_guild_role_update(self, before, after):
+        self.roles.update(before, after)
+
+    async def on_guild_role_delete(self, role):
+        self.roles.remove(role)
+
+    async def on_guild_remove(self, guild):
+        self.roles.forget(guild)
+
+    async def close(self):
+        self.scheduler.stop()
+        settings_service.stop()
+        self.loop_lag.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await flush_all()
+        await self.llm.close()
+        await self.http_pool.close()
+        await self.ledger.snapshot()
+        await self.storage.close()
+        await super().close()
+
+bot = LeoBot(command_prefix='!', intents=intents, **shard_options())
 
 BOT_OWNER_ID = 1131932116242939975
 
@@ -24,14 +125,26 @@ async def load_cogs():
 
 @bot.event
 async def on_ready():
-    print(f'Logged in as {bot.user}')
+    print(f'Logged in as {bot.user} on {len(bot.shards)} shard(s), {len(bot.guilds)} guild(s)')
     await bot.change_presence(activity=discord.Game(name="with Sleep Tokens!"))
-    guild = bot.guilds[0]  # Assumes bot is in one guild
-    color_roles = bot_settings.get('colorRoles', {})
-    for color_name, color_hex in color_roles.items():
-        role = discord.utils.get(guild.roles, name=color_name)
-        if not role:
-            await guild.create_role(name=color_name, color=discord.Color.from_str(color_hex))
+    if len(bot.guilds) == 1:
+        # Data saved before guild namespaces belongs to the one guild the bot served.
+        if settings_service.adopt_legacy(bot.guilds[0].id):
+            print(f"Moved top-level admins and channels to guild {bot.guilds[0].id}")
+        if await bot.storage.adopt_legacy(bot.guilds[0].id):
+            await bot.ledger.load()
+            # Cogs that index storage in memory rebuild from the moved rows.
+            bot.dispatch("legacy_adopted", bot.guilds[0].id)
+
+@bot.event
+async def on_shard_ready(shard_id):
+    guilds = [guild for guild in bot.guilds if guild.shard_id == shard_id]
+    await asyncio.gather(*(bot.prepare_guild(guild) for guild in guilds))
+    print(f'Shard {shard_id} ready with {len(guilds)} guild(s)')
+
+@bot.event
+async def on_guild_join(guild):
+    await bot.prepare_guild(guild)
 
 # Start bot
 async def main():
@@ -39,5 +152,4 @@ async def main():
     await bot.start(DISCORD_TOKEN)
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
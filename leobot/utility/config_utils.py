@@ -1,39 +1,225 @@
+import asyncio
+import copy
 import json
 import os
+import re
+from .utility_functions import write_atomic
 
-def load_bot_settings():
-    try:
-        with open('data/bot_settings.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {
-            "colorRoles": {
-                "Red": "#FF0000",
-                "Green": "#00FF00",
-                "Blue": "#0000FF",
-                "Yellow": "#FFFF00",
-                "Purple": "#800080",
-                "Cyan": "#00FFFF",
-                "Orange": "#FF6600",
-                "Pink": "#FFC0CB",
-                "Brown": "#A52A2A",
-                "Gray": "#808080",
-                "Navy": "#000080",
-                "Teal": "#008080",
-                "Violet": "#EE82EE",
-                "Salmon": "#FA8072",
-                "Gold": "#FFD700",
-                "Silver": "#C0C0C0",
-                "Turquoise": "#40E0D0",
-                "Magenta": "#FF00FF",
-                "The Archive": "#9bdeed",
-                "Lime": "#00FF00"
-            }
-        }
-
-def save_bot_settings(data):
-    os.makedirs('data', exist_ok=True)
-    with open('data/bot_settings.json', 'w') as f:
-        json.dump(data, f, indent=4)
-
-bot_settings = load_bot_settings()
+SETTINGS_FILE = 'data/bot_settings.json'
+RELOAD_INTERVAL = 5.0
+CHANNEL_KEYS = ("playerCardChannel", "triviaChannel", "modChannel")
+# Only ever read from a guild's own section; IDs in one guild mean nothing
+# in another. `botAdmins` is the bot-wide admin list.
+GUILD_ONLY_KEYS = ("admins", "channelIds")
+HEX_COLOR = re.compile(r"#[0-9A-Fa-f]{6}")
+
+DEFAULT_SETTINGS = {
+    "colorRoles": {
+        "Red": "#FF0000",
+        "Green": "#00FF00",
+        "Blue": "#0000FF",
+        "Yellow": "#FFFF00",
+        "Purple": "#800080",
+        "Cyan": "#00FFFF",
+        "Orange": "#FF6600",
+        "Pink": "#FFC0CB",
+        "Brown": "#A52A2A",
+        "Gray": "#808080",
+        "Navy": "#000080",
+        "Teal": "#008080",
+        "Violet": "#EE82EE",
+        "Salmon": "#FA8072",
+        "Gold": "#FFD700",
+        "Silver": "#C0C0C0",
+        "Turquoise": "#40E0D0",
+        "Magenta": "#FF00FF",
+        "The Archive": "#9bdeed",
+        "Lime": "#00FF00"
+    }
+}
+
+def _snowflake(value, where):
+    # IDs may be written as numbers or digit strings; both become ints.
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit():
+        raise ValueError(f"{where}: expected a Discord ID, got {value!r}")
+    return int(value)
+
+def validate(data, where="settings"):
+    # Checks the sections the permission, channel and colour lookups rely on
+    # and normalizes their IDs to ints. Raises ValueError on bad input.
+    if not isinstance(data, dict):
+        raise ValueError(f"{where}: expected an object")
+    for key in ("admins", "botAdmins"):
+        if key in data:
+            if not isinstance(data[key], list):
+                raise ValueError(f"{where}.{key}: expected a list")
+            data[key] = [_snowflake(admin, f"{where}.{key}") for admin in data[key]]
+    channel_ids = data.get("channelIds")
+    if channel_ids is not None:
+        if not isinstance(channel_ids, dict):
+            raise ValueError(f"{where}.channelIds: expected an object")
+        for key, value in channel_ids.items():
+            if value is not None:
+                channel_ids[key] = _snowflake(value, f"{where}.channelIds.{key}")
+    color_roles = data.get("colorRoles")
+    if color_roles is not None:
+        if not isinstance(color_roles, dict):
+            raise ValueError(f"{where}.colorRoles: expected an object")
+        for name, value in color_roles.items():
+            if not isinstance(value, str) or not HEX_COLOR.fullmatch(value):
+                raise ValueError(f"{where}.colorRoles.{name}: expected #RRGGBB, got {value!r}")
+    guilds = data.get("guilds")
+    if guilds is not None:
+        if not isinstance(guilds, dict):
+            raise ValueError(f"{where}.guilds: expected an object")
+        for guild_id, overrides in guilds.items():
+            _snowflake(guild_id, f"{where}.guilds")
+            validate(overrides, f"{where}.guilds.{guild_id}")
+    return data
+
+class GuildSettings:
+    # The effective settings for one guild (or the bot-wide ones for DMs):
+    # global settings with the guild's section laid over them, nested
+    # sections merged one level deep. Admins and channel IDs are
+    # precomputed so the checks on every command are O(1).
+    __slots__ = ("data", "admins", "channels", "color_roles")
+
+    def __init__(self, data):
+        self.data = data
+        self.admins = frozenset(data.get("admins", []))
+        channel_ids = data.get("channelIds") or {}
+        self.channels = {key: channel_ids.get(key) for key in CHANNEL_KEYS}
+        self.color_roles = data.get("colorRoles", {})
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def channel(self, key):
+        return self.channels.get(key)
+
+def merge_guild(data, overrides):
+    merged = {key: value for key, value in data.items() if key not in GUILD_ONLY_KEYS}
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    merged["admins"] = data.get("botAdmins", []) + overrides.get("admins", [])
+    return merged
+
+class SettingsSnapshot:
+    # Immutable view of one version of the settings file. A reload builds a
+    # new snapshot and swaps it in with one assignment, so readers never see
+    # a half-applied file.
+    __slots__ = ("data", "default", "guilds")
+
+    def __init__(self, data):
+        self.data = data
+        self.default = GuildSettings(merge_guild(data, {}))
+        self.guilds = {}  # guild_id: GuildSettings, built on first use
+
+    def guild(self, guild_id):
+        if guild_id is None:
+            return self.default
+        settings = self.guilds.get(guild_id)
+        if settings is None:
+            overrides = self.data.get("guilds", {}).get(str(guild_id))
+            settings = GuildSettings(merge_guild(self.data, overrides)) if overrides else self.default
+            self.guilds[guild_id] = settings
+        return settings
+
+class SettingsService:
+    def __init__(self, path=SETTINGS_FILE):
+        self.path = path
+        self.signature = None
+        self.snapshot = SettingsSnapshot(self.read())
+        self.task = None
+
+    @property
+    def data(self):
+        return self.snapshot.data
+
+    def guild(self, guild_id):
+        return self.snapshot.guild(guild_id)
+
+    def is_admin(self, guild_id, user_id):
+        return user_id in self.snapshot.guild(guild_id).admins
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read(self):
+        self.signature = self._stat()
+        try:
+            with open(self.path, 'r') as f:
+                return validate(json.load(f))
+        except FileNotFoundError:
+            return copy.deepcopy(DEFAULT_SETTINGS)
+
+    def reload(self):
+        # A broken edit leaves the running settings untouched.
+        signature = self._stat()
+        try:
+            snapshot = SettingsSnapshot(self.read())
+        except (ValueError, OSError) as e:
+            self.signature = signature
+            print(f"Settings reload failed, keeping previous settings: {e}")
+            return False
+        self.snapshot = snapshot
+        return True
+
+    def reload_if_changed(self):
+        if self._stat() != self.signature:
+            return self.reload()
+        return False
+
+    def copy(self):
+        # A private copy to edit and hand back to save().
+        return copy.deepcopy(self.snapshot.data)
+
+    def save(self, data):
+        validate(data)
+        write_atomic(self.path, json.dumps(data, indent=4))
+        self.signature = self._stat()
+        self.snapshot = SettingsSnapshot(data)
+
+    def adopt_legacy(self, guild_id):
+        # Settings files from before guild sections kept the one guild's
+        # admins and channels at the top level; move them into its section.
+        data = self.copy()
+        legacy = {key: data.pop(key) for key in GUILD_ONLY_KEYS if key in data}
+        if not legacy:
+            return False
+        overrides = guild_overrides(data, guild_id)
+        for key, value in legacy.items():
+            overrides.setdefault(key, value)
+        self.save(data)
+        return True
+
+    def start(self, interval=RELOAD_INTERVAL):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.watch(interval))
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def watch(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            if self.reload_if_changed():
+                print("Settings reloaded")
+
+def guild_overrides(data, guild_id):
+    # The mutable per-guild section of a settings copy, created on first write.
+    return data.setdefault("guilds", {}).setdefault(str(guild_id), {})
+
+def guild_settings(guild_id):
+    return settings_service.guild(guild_id)
+
+settings_service = SettingsService()
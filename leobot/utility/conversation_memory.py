@@ -0,0 +1,75 @@
+import asyncio
+from collections import deque
+from .summarizer import estimate_tokens
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a chat between a user and an assistant. "
+    "Keep names, facts, preferences and open questions; drop small talk. "
+    "Answer with the new summary only, in under 120 words."
+)
+
+class ConversationMemory:
+    # Recent turns are kept verbatim in a bounded deque; once more than
+    # `compress_after` turns pile up, the oldest are folded into a rolling
+    # summary in the background. Memory per conversation stays flat: at most
+    # `max_turns` turns plus one summary of at most `max_summary_chars`.
+    __slots__ = (
+        "turns", "summary", "token_budget", "compress_after", "keep_recent",
+        "max_summary_chars", "compress_task"
+    )
+
+    def __init__(self, token_budget=1500, max_turns=24, compress_after=12, keep_recent=6, max_summary_chars=1200):
+        self.turns = deque(maxlen=max_turns)
+        self.summary = ""
+        self.token_budget = token_budget
+        self.compress_after = compress_after
+        self.keep_recent = keep_recent
+        self.max_summary_chars = max_summary_chars
+        self.compress_task = None
+
+    def add(self, role, content):
+        self.turns.append({"role": role, "content": content})
+
+    def context(self, reserved_tokens=0):
+        # Newest turns first until the budget runs out, then put them back in
+        # order behind the summary.
+        budget = self.token_budget - reserved_tokens
+        messages = []
+        if self.summary:
+            budget -= estimate_tokens(self.summary)
+        for turn in reversed(self.turns):
+            cost = estimate_tokens(turn["content"])
+            if messages and cost > budget:
+                break
+            messages.append(turn)
+            budget -= cost
+        messages.reverse()
+        if self.summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        return messages
+
+    def maybe_compress(self, summarize):
+        # summarize(previous_summary, turns) -> new summary text
+        if len(self.turns) <= self.compress_after:
+            return
+        if self.compress_task is not None and not self.compress_task.done():
+            return
+        self.compress_task = asyncio.create_task(self.compress(summarize))
+
+    async def compress(self, summarize):
+        old_turns = list(self.turns)[:len(self.turns) - self.keep_recent]
+        try:
+            summary = await summarize(self.summary, old_turns)
+        except Exception as e:
+            print(f"Conversation compression error: {e}")
+            return
+        # Turns added while the summary was being written stay in the deque;
+        # only the ones that were summarized are dropped.
+        summarized = {id(turn) for turn in old_turns}
+        while self.turns and id(self.turns[0]) in summarized:
+            self.turns.popleft()
+        self.summary = (summary or "")[:self.max_summary_chars]
+
+    def cancel(self):
+        if self.compress_task is not None:
+            self.compress_task.cancel()
@@ -0,0 +1,190 @@
+import time
+from .persistence import get_store
+
+SESSIONS_FILE = 'data/form_sessions.json'
+CANCEL_WORD = "cancel"
+
+# What a step does with an answer its parser rejects.
+RETRY = "retry"        # explain and ask again
+FALLBACK = "fallback"  # explain and use step.fallback(session) instead
+CANCEL = "cancel"      # explain and close the form
+
+def _text(session, content):
+    return content
+
+class Step:
+    # prompt is a string or prompt(session) -> str; parse(session, content)
+    # returns the value to store under `key` or raises ValueError, whose
+    # message is sent back to the user.
+    __slots__ = ("key", "prompt", "parse", "invalid", "fallback")
+
+    def __init__(self, key, prompt, parse=_text, invalid=RETRY, fallback=None):
+        self.key = key
+        self.prompt = prompt
+        self.parse = parse
+        self.invalid = invalid
+        self.fallback = fallback
+
+class Form:
+    # on_complete(session) is awaited once every step has an answer.
+    # `timeout` is the time allowed for each step.
+    __slots__ = ("name", "steps", "on_complete", "timeout", "timeout_message")
+
+    def __init__(self, name, steps, on_complete, timeout=300, timeout_message="Timed out. Form cancelled."):
+        self.name = name
+        self.steps = steps
+        self.on_complete = on_complete
+        self.timeout = timeout
+        self.timeout_message = timeout_message
+
+class FormSession:
+    __slots__ = ("form", "user_id", "channel_id", "index", "answers", "context", "deadline")
+
+    def __init__(self, form, user_id, channel_id, index=0, answers=None, context=None, deadline=0.0):
+        self.form = form
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.index = index
+        self.answers = answers if answers is not None else {}
+        self.context = context if context is not None else {}
+        self.deadline = deadline
+
+    @property
+    def key(self):
+        return (self.user_id, self.channel_id)
+
+    @property
+    def step(self):
+        return self.form.steps[self.index]
+
+    def to_json(self):
+        return {
+            "form": self.form.name, "user_id": self.user_id, "channel_id": self.channel_id,
+            "index": self.index, "answers": self.answers, "context": self.context, "deadline": self.deadline
+        }
+
+class FormManager:
+    # Multi-step forms as one state machine per (user_id, channel_id). Open
+    # sessions are claimed on the message router, so an answer reaches its
+    # session by a dict lookup; unlike pending wait_for listeners, nothing is
+    # evaluated for the messages of users without a form. Step deadlines live
+    # in the shared scheduler, and progress is written behind to
+    # SESSIONS_FILE so open forms resume after a restart.
+    def __init__(self, bot, path=SESSIONS_FILE):
+        self.bot = bot
+        self.forms = {}  # name: Form
+        self.sessions = {}  # (user_id, channel_id): FormSession
+        self.store = get_store(path)
+
+    def register(self, form):
+        # Cogs register their forms on load; saved sessions of the form resume then.
+        self.forms[form.name] = form
+        now = time.time()
+        for entry_key, entry in list(self.store.data.items()):
+            if entry.get("form") != form.name:
+                continue
+            remaining = entry["deadline"] - now
+            if remaining <= 0 or entry["index"] >= len(form.steps):
+                del self.store.data[entry_key]
+                self.store.mark_dirty()
+                continue
+            session = FormSession(
+                form, entry["user_id"], entry["channel_id"], entry["index"], entry["answers"], entry["context"]
+            )
+            self.activate(session, remaining)
+
+    def unregister(self, name):
+        # Open sessions stay on disk and resume when the form is registered again.
+        self.forms.pop(name, None)
+        for session in [session for session in self.sessions.values() if session.form.name == name]:
+            self.sessions.pop(session.key)
+            self.bot.router.release_form(session.key)
+            self.bot.scheduler.cancel(("form", session.key))
+
+    async def start(self, name, user_id, channel, context=None):
+        form = self.forms[name]
+        previous = self.sessions.get((user_id, channel.id))
+        if previous is not None:
+            self.end(previous)
+        session = FormSession(form, user_id, channel.id, context=context)
+        # Claimed before the prompt goes out so a quick answer can't miss it;
+        # if the prompt can't be sent, nobody will ever answer, so close it.
+        self.activate(session, form.timeout)
+        try:
+            await self.bot.sender.send(channel, self.prompt(session))
+        except Exception:
+            self.end(session)
+            raise
+        return session
+
+    def activate(self, session, delay):
+        self.sessions[session.key] = session
+        self.bot.router.claim_form(session.key, "forms", self.handle)
+        self.touch(session, delay)
+
+    def touch(self, session, delay=None):
+        delay = session.form.timeout if delay is None else delay
+        session.deadline = time.time() + delay
+        self.bot.scheduler.schedule(("form", session.key), delay, lambda: self.expire(session))
+        self.store.data[f"{session.user_id}:{session.channel_id}"] = session.to_json()
+        self.store.mark_dirty()
+
+    def end(self, session):
+        if self.sessions.get(session.key) is not session:
+            return False
+        del self.sessions[session.key]
+        self.bot.router.release_form(session.key)
+        self.bot.scheduler.cancel(("form", session.key))
+        self.store.data.pop(f"{session.user_id}:{session.channel_id}", None)
+        self.store.mark_dirty()
+        return True
+
+    async def expire(self, session):
+        if self.end(session):
+            await self.bot.sender.send(await self.channel(session.channel_id), session.form.timeout_message)
+
+    async def channel(self, channel_id):
+        # DM channels of resumed sessions may not be cached yet.
+        return self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+
+    def prompt(self, session):
+        prompt = session.step.prompt
+        return prompt(session) if callable(prompt) else prompt
+
+    async def handle(self, message):
+        session = self.sessions.get((message.author.id, message.channel.id))
+        if session is None:
+            return
+        content = message.content.strip()
+        if content.lower() == CANCEL_WORD:
+            self.end(session)
+            await self.bot.sender.send(message.channel, "Cancelled.")
+            return
+        # Session state is advanced before the first await, so answers sent
+        # in quick succession are applied in order.
+        step = session.step
+        notice = None
+        try:
+            value = step.parse(session, content)
+        except ValueError as e:
+            notice = str(e) or "Invalid input."
+            if step.invalid == CANCEL:
+                self.end(session)
+                await self.bot.sender.send(message.channel, notice)
+                return
+            if step.invalid == RETRY:
+                self.touch(session)
+                await self.bot.sender.send(message.channel, f"{notice}\n{self.prompt(session)}")
+                return
+            value = step.fallback(session)
+        session.answers[step.key] = value
+        session.index += 1
+        if session.index >= len(session.form.steps):
+            self.end(session)
+            if notice:
+                await self.bot.sender.send(message.channel, notice)
+            await session.form.on_complete(session)
+            return
+        self.touch(session)
+        text = self.prompt(session)
+        await self.bot.sender.send(message.channel, f"{notice}\n{text}" if notice else text)
@@ -0,0 +1,94 @@
+import aiohttp
+import time
+from .config_utils import settings_service
+from .metrics import metrics
+
+class HTTPSessionManager:
+    # Bot-wide aiohttp session. Created lazily on first use so it is always
+    # bound to the running event loop, and closed once from LeoBot.close().
+    def __init__(self, settings=None):
+        settings = settings if settings is not None else settings_service.data.get("http", {})
+        self.limit = settings.get("limit", 100)
+        self.limit_per_host = settings.get("limitPerHost", 10)
+        self.keepalive_timeout = settings.get("keepaliveTimeout", 30)
+        self.dns_cache_ttl = settings.get("dnsCacheTtl", 300)
+        self.timeout = settings.get("timeout", 30)
+        self._session = None
+        self.stats = {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+            "errors": 0
+        }
+
+    def _trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        async def count(key):
+            self.stats[key] += 1
+
+        async def on_request_start(session, ctx, params):
+            ctx.start = time.perf_counter()
+            await count("requests")
+
+        async def on_request_end(session, ctx, params):
+            # Time to response headers, by host.
+            metrics.observe(
+                "leobot_outbound_seconds", time.perf_counter() - ctx.start,
+                provider=params.url.host, operation=params.method
+            )
+
+        async def on_connection_create_end(session, ctx, params):
+            await count("connections_created")
+
+        async def on_connection_reuseconn(session, ctx, params):
+            await count("connections_reused")
+
+        async def on_dns_cache_hit(session, ctx, params):
+            await count("dns_cache_hits")
+
+        async def on_dns_cache_miss(session, ctx, params):
+            await count("dns_cache_misses")
+
+        async def on_request_exception(session, ctx, params):
+            await count("errors")
+            metrics.inc("leobot_outbound_errors_total", provider=params.url.host)
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[self._trace_config()]
+            )
+        return self._session
+
+    def pool_stats(self):
+        stats = dict(self.stats)
+        connections = stats["connections_created"] + stats["connections_reused"]
+        stats["reuse_rate"] = stats["connections_reused"] / connections if connections else 0.0
+        return stats
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,163 @@
+import random
+from datetime import datetime, timezone
+
+ALL_TIME = "all"
+MAX_LEVEL = 32
+BRANCHING = 4  # A node is promoted to the next level with probability 1/BRANCHING
+
+class _Node:
+    __slots__ = ("key", "forward", "span")
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level  # Level-0 steps skipped by each forward link
+
+class RankedSkipList:
+    # Indexable skip list: insert, delete and "how many keys sort before
+    # this one" are all O(log n) expected, and reading the first k keys is
+    # O(log n + k).
+    def __init__(self):
+        self.head = _Node(None, MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        level = 1
+        while level < MAX_LEVEL and random.randrange(BRANCHING) == 0:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            rank[i] = rank[i + 1] if i + 1 < self.level else 0
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = self.size
+            self.level = level
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.size += 1
+
+    def delete(self, key):
+        update = [None] * MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+        target = node.forward[0]
+        if target is None or target.key != key:
+            return False
+        for i in range(self.level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+        return True
+
+    def count_less(self, key):
+        count = 0
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                count += node.span[i]
+                node = node.forward[i]
+        return count
+
+    def first(self, k):
+        keys = []
+        node = self.head.forward[0]
+        while node is not None and len(keys) < k:
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+class Leaderboard:
+    # Scores ordered by (-score, user_id). Ranks are competition ranks:
+    # players on equal scores share a rank ("1, 2, 2, 4").
+    def __init__(self):
+        self.scores = {}  # user_id: score
+        self.order = RankedSkipList()
+
+    def __len__(self):
+        return len(self.scores)
+
+    def set(self, user_id, score):
+        old = self.scores.get(user_id)
+        if old is not None:
+            self.order.delete((-old, user_id))
+        self.scores[user_id] = score
+        self.order.insert((-score, user_id))
+
+    def add(self, user_id, delta):
+        self.set(user_id, self.scores.get(user_id, 0) + delta)
+
+    def rank(self, user_id):
+        # (rank, score), or None if the user has no score on this board.
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.order.count_less((-score, -1)) + 1, score
+
+    def top(self, k):
+        return [(user_id, -negative) for negative, user_id in self.order.first(k)]
+
+class LeaderboardIndex:
+    # In-memory boards per guild: ALL_TIME, "category:<name>" and
+    # "season:<name>". Storage stays the source of truth; this mirrors it for
+    # rank and top-k reads.
+    def __init__(self):
+        self.boards = {}  # (guild_id, board): Leaderboard
+
+    def board(self, guild_id, board):
+        leaderboard = self.boards.get((guild_id, board))
+        if leaderboard is None:
+            leaderboard = self.boards[(guild_id, board)] = Leaderboard()
+        return leaderboard
+
+    def load(self, rows):
+        for guild_id, board, user_id, score in rows:
+            self.board(guild_id, board).set(user_id, score)
+
+    def add(self, guild_id, boards, scores):
+        for board in boards:
+            leaderboard = self.board(guild_id, board)
+            for user_id, delta in scores.items():
+                leaderboard.add(user_id, delta)
+
+    def guild_boards(self, guild_id):
+        return {board: leaderboard for (gid, board), leaderboard in self.boards.items() if gid == guild_id}
+
+def category_board(category):
+    return f"category:{category}"
+
+def season_board(season=None):
+    # An explicit season name wins; otherwise seasons are calendar quarters.
+    if not season:
+        now = datetime.now(timezone.utc)
+        season = f"{now.year}-Q{(now.month - 1) // 3 + 1}"
+    return f"season:{season}"
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import openai
+from dotenv import load_dotenv
+from .config_utils import settings_service
+from .metrics import metrics
+
+load_dotenv()
+
+PROVIDERS = {
+    "grok": {
+        "api_key_env": "GROK3_API_KEY",
+        "base_url": "https://api.x.ai/v1",
+        "concurrency": 8,
+        "timeout": 30
+    },
+    "gpt": {
+        "api_key_env": "GPT4O_API_KEY",
+        "base_url": None,
+        "concurrency": 8,
+        "timeout": 30
+    }
+}
+
+class LLMProvider:
+    # One long-lived AsyncOpenAI client per provider keeps its connection pool
+    # warm; the semaphore caps how many requests are in flight at once.
+    def __init__(self, name, api_key, base_url=None, concurrency=8, timeout=30):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout)
+        return self._client
+
+    async def chat(self, model, messages, timeout=None, **kwargs):
+        timeout = timeout or self.timeout
+        async with self.semaphore:
+            with metrics.timer("leobot_outbound_seconds", provider=self.name, operation="chat"):
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(model=model, messages=messages, timeout=timeout, **kwargs),
+                    timeout
+                )
+        return response.choices[0].message.content
+
+    async def stream_chat(self, model, messages, timeout=None, **kwargs):
+        # Yields text deltas as they arrive. The timeout covers the whole
+        # stream, and the concurrency slot is held until it finishes.
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with self.semaphore:
+            start = loop.time()
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model, messages=messages, timeout=timeout, stream=True, **kwargs),
+                timeout
+            )
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            metrics.observe("leobot_outbound_seconds", loop.time() - start, provider=self.name, operation="stream")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+class LLMClients:
+    def __init__(self, settings=None):
+        settings = settings if settings is not None else settings_service.data.get("llm", {})
+        self.providers = {}
+        for name, defaults in PROVIDERS.items():
+            options = {**defaults, **settings.get(name, {})}
+            self.providers[name] = LLMProvider(
+                name,
+                api_key=os.getenv(options["api_key_env"]),
+                base_url=options["base_url"],
+                concurrency=options["concurrency"],
+                timeout=options["timeout"]
+            )
+
+    def __getitem__(self, name):
+        return self.providers[name]
+
+    async def close(self):
+        for provider in self.providers.values():
+            await provider.close()
@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict, deque, namedtuple
+
+MessageRecord = namedtuple("MessageRecord", ["author_id", "timestamp", "content"])
+
+class ChannelBuffer:
+    __slots__ = ("records", "since")
+
+    def __init__(self, max_messages, since):
+        self.records = deque(maxlen=max_messages)
+        # Every message at or after `since` is in the buffer (until a gap
+        # resets it); earlier ones come from REST history, whose before= is
+        # exclusive.
+        self.since = since
+
+    def append(self, record):
+        if len(self.records) == self.records.maxlen:
+            # The oldest record is about to be evicted, so coverage starts at
+            # the one after it and REST history still includes the evicted one.
+            self.since = self.records[1].timestamp if len(self.records) > 1 else record.timestamp
+        self.records.append(record)
+
+    def expire(self, cutoff):
+        while self.records and self.records[0].timestamp < cutoff:
+            self.since = self.records.popleft().timestamp
+        self.since = max(self.since, cutoff)
+
+class MessageBuffer:
+    # Bounded per-channel ring buffers filled from gateway messages. Caps:
+    # messages per channel, number of channels (least recently active is
+    # dropped), characters per record and record age.
+    def __init__(self, max_messages=5000, max_channels=200, max_age=86400, max_content=2000):
+        self.max_messages = max_messages
+        self.max_channels = max_channels
+        self.max_age = max_age
+        self.max_content = max_content
+        self.channels = OrderedDict()  # channel_id: ChannelBuffer
+        self.evicted = {}  # channel_id: time its buffer was dropped
+        self.listening_since = time.time()
+
+    def add(self, channel_id, author_id, timestamp, content):
+        buffer = self.channels.get(channel_id)
+        if buffer is None:
+            since = max(self.listening_since, self.evicted.pop(channel_id, 0))
+            buffer = self.channels[channel_id] = ChannelBuffer(self.max_messages, since)
+            while len(self.channels) > self.max_channels:
+                evicted_id, _ = self.channels.popitem(last=False)
+                self.evicted[evicted_id] = timestamp
+        else:
+            self.channels.move_to_end(channel_id)
+        buffer.append(MessageRecord(author_id, timestamp, content[:self.max_content]))
+        buffer.expire(time.time() - self.max_age)
+
+    def mark_gap(self):
+        # Called after a fresh gateway session, when events may have been missed.
+        now = time.time()
+        self.listening_since = now
+        self.evicted.clear()
+        for buffer in self.channels.values():
+            buffer.since = now
+
+    def covered_since(self, channel_id):
+        buffer = self.channels.get(channel_id)
+        if buffer is None:
+            return max(self.listening_since, self.evicted.get(channel_id, 0), time.time() - self.max_age)
+        buffer.expire(time.time() - self.max_age)
+        return buffer.since
+
+    def records_after(self, channel_id, start):
+        buffer = self.channels.get(channel_id)
+        if buffer is None:
+            return []
+        # Records older than `since` (kept across a gap) are served by REST.
+        since = buffer.since
+        return [record for record in buffer.records if record.timestamp > start and record.timestamp >= since]
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from .metrics import metrics
+
+class MessageRouter:
+    # The bot's single on_message entry point. Each message is parsed for a
+    # command once, then handed to the handlers for its kinds:
+    #   "message"    - every non-command message (e.g. the summary buffer)
+    #   "moderation" - every non-command message to be screened
+    # plus the handler claimed for its (user_id, channel_id), if any: an open
+    # form session takes the message ahead of a conversation. Handlers run as
+    # separate tasks and are timed individually.
+    def __init__(self, bot):
+        self.bot = bot
+        self.handlers = {"message": {}, "moderation": {}}  # kind: {name: handler}
+        self.conversations = {}  # (user_id, channel_id): (name, handler)
+        self.forms = {}  # (user_id, channel_id): (name, handler)
+        self.timings = {}  # name: [calls, total_seconds, max_seconds]
+        self.tasks = set()  # Running handler tasks; the loop only keeps weak references
+
+    def spawn(self, name, handler, message):
+        task = asyncio.create_task(self.timed(name, handler, message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def register(self, kind, name, handler):
+        self.handlers[kind][name] = handler
+
+    def unregister(self, name):
+        for handlers in self.handlers.values():
+            handlers.pop(name, None)
+        for claims in (self.conversations, self.forms):
+            for key in [key for key, (owner, _) in claims.items() if owner == name]:
+                del claims[key]
+
+    def claim(self, key, name, handler):
+        self.conversations[key] = (name, handler)
+
+    def release(self, key):
+        self.conversations.pop(key, None)
+
+    def claim_form(self, key, name, handler):
+        self.forms[key] = (name, handler)
+
+    def release_form(self, key):
+        self.forms.pop(key, None)
+
+    def record(self, name, elapsed):
+        timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+    async def timed(self, name, handler, *args):
+        start = time.perf_counter()
+        try:
+            await handler(*args)
+        except Exception as e:
+            metrics.inc("leobot_handler_errors_total", handler=name)
+            print(f"Message handler {name} failed: {e}")
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(name, elapsed)
+            metrics.observe("leobot_handler_seconds", elapsed, handler=name)
+
+    async def route(self, message):
+        if message.author.bot:
+            return
+        ctx = await self.bot.get_context(message)
+        if ctx.valid:
+            start = time.perf_counter()
+            await self.bot.invoke(ctx)
+            elapsed = time.perf_counter() - start
+            self.record("commands", elapsed)
+            metrics.observe("leobot_command_seconds", elapsed, command=ctx.command.qualified_name)
+            return
+        for kind in ("message", "moderation"):
+            for name, handler in self.handlers[kind].items():
+                self.spawn(name, handler, message)
+        key = (message.author.id, message.channel.id)
+        claimed = self.forms.get(key) or self.conversations.get(key)
+        if claimed:
+            name, handler = claimed
+            self.spawn(name, handler, message)
+
+    def stats(self):
+        return {
+            name: {"calls": calls, "avg": total / calls if calls else 0.0, "max": longest}
+            for name, (calls, total, longest) in self.timings.items()
+        }
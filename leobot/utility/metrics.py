@@ -0,0 +1,184 @@
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+# Upper bounds in seconds, shared by every latency histogram.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "leobot_command_seconds": "Time to run a command, by command.",
+    "leobot_handler_seconds": "Time to run a message handler, by handler.",
+    "leobot_handler_errors_total": "Message handlers that raised, by handler.",
+    "leobot_command_errors_total": "Commands that raised, by command.",
+    "leobot_moderation_dropped_total": "Messages left unmoderated because the moderation queue was full.",
+    "leobot_outbound_seconds": "Outbound API call time, by provider and operation.",
+    "leobot_outbound_errors_total": "Outbound HTTP requests that failed, by host.",
+    "leobot_discord_send_seconds": "Time for a channel message send to complete.",
+    "leobot_storage_seconds": "Database operation time, including executor queueing, by operation.",
+    "leobot_disk_write_seconds": "Atomic JSON file write time.",
+    "leobot_conversation_reply_seconds": "Conversation reply time, to first token and to completion.",
+    "leobot_event_loop_lag_seconds": "How late the event loop ran a timer that was due."
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation, capped at the max seen.
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+class Metrics:
+    # Process-wide registry. Histograms and counters are keyed by name and a
+    # sorted tuple of label pairs; gauges are callables sampled at scrape
+    # time, so queue depths cost nothing until someone looks.
+    def __init__(self):
+        self.histograms = {}  # name: {labels: Histogram}
+        self.counters = {}  # name: {labels: value}
+        self.gauges = {}  # name: (help, callable)
+
+    def observe(self, name, value, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def inc(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def gauge(self, name, help, read):
+        self.gauges[name] = (help, read)
+
+    def remove_gauge(self, name):
+        self.gauges.pop(name, None)
+
+    def series(self, name):
+        # {labels: Histogram} for one histogram name.
+        return self.histograms.get(name, {})
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4.
+        lines = []
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+        for name, (help, read) in sorted(self.gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                print(f"Gauge {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class LoopLagMonitor:
+    # Sleeps for `interval` and measures how much later than that it woke
+    # up; blocking calls on the loop show up directly as lag.
+    def __init__(self, metrics, interval=0.5):
+        self.metrics = metrics
+        self.interval = interval
+        self.last = 0.0
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(loop.time() - start - self.interval, 0.0)
+            self.metrics.observe("leobot_event_loop_lag_seconds", self.last)
+
+class MetricsServer:
+    # Serves GET /metrics on a local port for a Prometheus scraper.
+    def __init__(self, metrics, host="127.0.0.1", port=9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def handle(self, request):
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+        except OSError as e:
+            print(f"Metrics endpoint disabled, cannot bind {self.host}:{self.port}: {e}")
+            await self.stop()
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+metrics = Metrics()
@@ -0,0 +1,55 @@
+import re
+from .ttl_cache import normalize_text
+
+DEFAULT_BENIGN = [
+    "lol", "lmao", "lmfao", "rofl", "haha", "hehe", "xd", "ok", "okay", "k", "yes", "yeah", "yep", "no", "nope",
+    "hi", "hey", "hello", "bye", "gn", "gm", "good morning", "good night", "ty", "thanks", "thank you", "np",
+    "gg", "nice", "cool", "same", "true", "omg", "wow", "brb", "idk"
+]
+URL_ONLY = re.compile(r"^(<?https?://\S+>?\s*)+$")
+HAS_LETTER = re.compile(r"[^\W\d_]")
+LAUGHTER = re.compile(r"^(ha|he|hi|lo+l|l+m+a+o+|x+d+)+$")
+
+def compile_terms(terms):
+    # Plain words match on word boundaries; entries wrapped in slashes are
+    # treated as raw regexes. Everything is compiled into one pattern.
+    parts = []
+    for term in terms:
+        if len(term) > 2 and term.startswith("/") and term.endswith("/"):
+            parts.append(term[1:-1])
+        else:
+            parts.append(r"\b" + re.escape(term.lower()) + r"\b")
+    return re.compile("|".join(parts), re.IGNORECASE) if parts else None
+
+class ModerationPrefilter:
+    # Decides obvious cases locally. check() returns 'appropriate',
+    # 'inappropriate', or None when the message needs the remote model.
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.blocked = compile_terms(settings.get("blockedTerms", []))
+        benign = settings.get("benignPhrases", DEFAULT_BENIGN)
+        self.benign = {normalize_text(phrase) for phrase in benign}
+        self.min_length = settings.get("minLength", 3)
+        self.stats = {"checked": 0, "appropriate": 0, "inappropriate": 0}
+
+    def classify(self, content):
+        if self.blocked and self.blocked.search(content):
+            return "inappropriate"
+        normalized = normalize_text(content)
+        stripped = normalized.rstrip("!?. ")
+        if len(normalized) < self.min_length or stripped in self.benign or LAUGHTER.match(stripped):
+            return "appropriate"
+        if not HAS_LETTER.search(normalized) or URL_ONLY.match(normalized):
+            return "appropriate"
+        return None
+
+    def check(self, content):
+        self.stats["checked"] += 1
+        verdict = self.classify(content)
+        if verdict:
+            self.stats[verdict] += 1
+        return verdict
+
+    def skip_rate(self):
+        checked = self.stats["checked"]
+        return (self.stats["appropriate"] + self.stats["inappropriate"]) / checked if checked else 0.0
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+class ModerationBatcher:
+    # Collects messages for up to `window` seconds (or `batch_size` messages)
+    # and classifies them with a single classify_batch(contents) call, which
+    # must return one verdict (or None for no verdict) per content in the
+    # same order. The queue is bounded: when classification falls behind,
+    # submit() sheds the message (counted in stats["dropped"]) instead of
+    # parking a task per message.
+    def __init__(self, classify_batch, on_verdict, window=2.0, batch_size=20, max_queue=500, max_in_flight=4):
+        self.classify_batch = classify_batch
+        self.on_verdict = on_verdict
+        self.window = window
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.worker = None
+        self.batches = set()  # Batches being classified, referenced until done
+        self.started_at = None
+        self.stats = {"messages": 0, "batches": 0, "errors": 0, "dropped": 0}
+
+    def submit(self, message):
+        # Returns False if the queue is full and the message was not queued.
+        if self.worker is None:
+            self.started_at = time.monotonic()
+            self.worker = asyncio.create_task(self.run())
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        return True
+
+    async def collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self.collect()
+            await self.in_flight.acquire()
+            task = asyncio.create_task(self.process(batch))
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+
+    async def process(self, batch):
+        try:
+            verdicts = await self.classify_batch([message.content for message in batch])
+            self.stats["batches"] += 1
+            self.stats["messages"] += len(batch)
+            for message, verdict in zip(batch, verdicts):
+                await self.on_verdict(message, verdict)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Moderation batch error: {e}")
+        finally:
+            self.in_flight.release()
+
+    def throughput(self):
+        if self.started_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        return self.stats["messages"] / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
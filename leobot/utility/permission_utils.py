@@ -1,5 +1,7 @@
-from .config_utils import bot_settings
+from .config_utils import settings_service
 
 def is_mod(user):
-    admins = bot_settings.get("admins", [])
-    return str(user.id) in admins
+    # Members are checked against their guild's admins plus botAdmins;
+    # plain users (DMs) against botAdmins only. Admin IDs are a precomputed set of ints.
+    guild = getattr(user, "guild", None)
+    return settings_service.is_admin(guild.id if guild else None, user.id)
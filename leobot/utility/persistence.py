@@ -0,0 +1,56 @@
+import asyncio
+import json
+from .utility_functions import load_json, write_atomic
+
+FLUSH_INTERVAL = 5.0  # Seconds between a mutation and its write
+
+class JSONStore:
+    # Write-behind wrapper around a JSON file. Callers mutate `data` in place
+    # and call mark_dirty(); all mutations within FLUSH_INTERVAL are written
+    # together, serialized on the loop and written atomically off it.
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.data = load_json(path)
+        self.dirty = False
+        self.writes = 0
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    def mark_dirty(self):
+        self.dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        # mark_dirty() calls made while a write is in flight see this task
+        # still running and schedule nothing, so keep going until clean.
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if not self.dirty:
+                return
+
+    async def flush(self):
+        async with self._lock:
+            if not self.dirty:
+                return
+            text = json.dumps(self.data, separators=(',', ':'))
+            self.dirty = False
+            try:
+                await asyncio.to_thread(write_atomic, self.path, text)
+                self.writes += 1
+            except OSError as e:
+                self.dirty = True
+                print(f"Failed to write {self.path}: {e}")
+
+_stores = {}
+
+def get_store(path):
+    if path not in _stores:
+        _stores[path] = JSONStore(path)
+    return _stores[path]
+
+async def flush_all():
+    for store in list(_stores.values()):
+        await store.flush()
@@ -0,0 +1,129 @@
+import re
+
+# (field, question, heading) in card order.
+FIELDS = [
+    ("pronouns", "Pronouns?", "Pronouns"),
+    ("zodiac", "Zodiac?", "Zodiac"),
+    ("languages", "Languages?", "Languages"),
+    ("timezone", "Time Zone?", "Time Zone"),
+    ("country", "Country?", "Country"),
+    ("occupation", "Occupation?", "Occupation"),
+    ("band_member", "Favorite Band Member?", "Favorite Band Member"),
+    ("discovery", "Discover Sleep Token?", "Discover Sleep Token"),
+    ("youtube", "YouTube?", "YouTube"),
+    ("fun_facts", "Fun Facts?", "Fun Facts"),
+    ("hobbies", "Hobbies?", "Hobbies"),
+    ("food", "Favorite Food?", "Favorite Food"),
+    ("games", "Favorite Games?", "Favorite Games"),
+    ("show", "Favorite Show?", "Favorite Show"),
+    ("discord_open", "Discord Open?", "Discord Open?")
+]
+FIELD_NAMES = {field for field, _, _ in FIELDS}
+HEADINGS = {heading: field for field, _, heading in FIELDS}
+# Shorter names accepted in searches.
+FIELD_ALIASES = {"tz": "timezone", "band": "band_member", "member": "band_member", "game": "games", "language": "languages"}
+
+TOKEN = re.compile(r"\w+")
+QUERY_TERM = re.compile(r'(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+
+def tokenize(text):
+    # Unicode word characters, so "México" and "日本" index as whole words.
+    return TOKEN.findall(text.casefold())
+
+def render_card(display_name, fields, mention):
+    lines = [f"**{display_name}'s Player Card**\n"]
+    for field, _, heading in FIELDS:
+        lines.append(f"**{heading}**\n{fields.get(field, '')}")
+    return "\n".join(lines) + f"\n\nPlayer card created by {mention}"
+
+def parse_card(text):
+    # Recovers the fields from a card stored as rendered Markdown.
+    fields, current = {}, None
+    for line in text.splitlines():
+        heading = line[2:-2] if line.startswith("**") and line.endswith("**") else None
+        if heading in HEADINGS:
+            current = HEADINGS[heading]
+            fields[current] = []
+        elif current and not line.startswith("Player card created by"):
+            fields[current].append(line)
+    return {field: "\n".join(lines).strip() for field, lines in fields.items()}
+
+def parse_query(query):
+    # 'country:canada tz:"gmt+1" elden' -> [("country", ["canada"]), ("timezone", ["gmt", "1"]), (None, ["elden"])]
+    terms = []
+    for match in QUERY_TERM.finditer(query):
+        field, quoted, bare = match.groups()
+        if field is not None:
+            field = FIELD_ALIASES.get(field.lower(), field.lower())
+            if field not in FIELD_NAMES:
+                raise ValueError(f"Unknown field '{match.group(1)}'")
+        tokens = tokenize(quoted if quoted is not None else bare)
+        if tokens:
+            terms.append((field, tokens))
+    return terms
+
+class CardIndex:
+    # Inverted index from (field, token) to the users whose card has that
+    # token in that field, plus (None, token) for matches in any field, per
+    # guild. Updating a card replaces only that user's postings, and a query
+    # intersects the posting sets smallest first.
+    def __init__(self):
+        self.postings = {}  # guild_id: {(field, token): set(user_id)}
+        self.cards = {}  # guild_id: {user_id: {field: value}}
+
+    def __len__(self):
+        return sum(len(cards) for cards in self.cards.values())
+
+    def _keys(self, fields):
+        keys = set()
+        for field, value in fields.items():
+            for token in tokenize(value or ""):
+                keys.add((field, token))
+                keys.add((None, token))
+        return keys
+
+    def add(self, guild_id, user_id, fields):
+        self.remove(guild_id, user_id)
+        self.cards.setdefault(guild_id, {})[user_id] = dict(fields)
+        postings = self.postings.setdefault(guild_id, {})
+        for key in self._keys(fields):
+            postings.setdefault(key, set()).add(user_id)
+
+    def update(self, guild_id, user_id, field, value):
+        fields = dict(self.cards.get(guild_id, {}).get(user_id, {}))
+        fields[field] = value
+        self.add(guild_id, user_id, fields)
+
+    def remove(self, guild_id, user_id):
+        fields = self.cards.get(guild_id, {}).pop(user_id, None)
+        if fields is None:
+            return
+        postings = self.postings[guild_id]
+        for key in self._keys(fields):
+            users = postings.get(key)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del postings[key]
+
+    def get(self, guild_id, user_id):
+        return self.cards.get(guild_id, {}).get(user_id)
+
+    def search(self, guild_id, terms):
+        postings = self.postings.get(guild_id, {})
+        sets = []
+        for field, tokens in terms:
+            for token in tokens:
+                users = postings.get((field, token))
+                if not users:
+                    return set()
+                sets.append(users)
+        if not sets:
+            return set()
+        sets.sort(key=len)
+        result = set(sets[0])
+        for users in sets[1:]:
+            result &= users
+            if not result:
+                break
+        return result
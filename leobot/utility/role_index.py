@@ -0,0 +1,66 @@
+import asyncio
+import discord
+
+class RoleIndex:
+    # name -> role lookup per guild, built from the gateway cache the first
+    # time a guild is used and kept current by the role create/update/delete
+    # events, so lookups are O(1) instead of a scan of guild.roles. Like
+    # discord.utils.get, a name shared by several roles resolves to the first
+    # in guild order.
+    def __init__(self):
+        self.guilds = {}  # guild_id: {name: role}
+
+    def build(self, guild):
+        names = {}
+        for role in guild.roles:
+            names.setdefault(role.name, role)
+        self.guilds[guild.id] = names
+        return names
+
+    def names(self, guild):
+        names = self.guilds.get(guild.id)
+        if names is None:
+            names = self.build(guild)
+        return names
+
+    def get(self, guild, name):
+        return self.names(guild).get(name)
+
+    def add(self, role):
+        if role.guild.id in self.guilds:
+            self.guilds[role.guild.id].setdefault(role.name, role)
+
+    def remove(self, role):
+        names = self.guilds.get(role.guild.id)
+        if names is not None and names.get(role.name) is not None and names[role.name].id == role.id:
+            # Another role may share the name; fall back to it.
+            replacement = next((r for r in role.guild.roles if r.name == role.name and r.id != role.id), None)
+            if replacement is None:
+                del names[role.name]
+            else:
+                names[role.name] = replacement
+
+    def update(self, before, after):
+        self.remove(before)
+        self.add(after)
+
+    def forget(self, guild):
+        self.guilds.pop(guild.id, None)
+
+    async def ensure(self, guild, roles, concurrency=4):
+        # roles: {name: hex colour}. Missing roles are created concurrently,
+        # at most `concurrency` requests at a time.
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create(name, color_hex):
+            async with semaphore:
+                role = await guild.create_role(name=name, color=discord.Color.from_str(color_hex))
+                self.add(role)
+                return role
+
+        missing = [(name, color_hex) for name, color_hex in roles.items() if self.get(guild, name) is None]
+        results = await asyncio.gather(*(create(name, color_hex) for name, color_hex in missing), return_exceptions=True)
+        for (name, _), result in zip(missing, results):
+            if isinstance(result, Exception):
+                print(f"Failed to create role {name} in {guild.id}: {result}")
+        return [result for result in results if not isinstance(result, Exception)]
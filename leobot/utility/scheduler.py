@@ -0,0 +1,82 @@
+import asyncio
+import heapq
+import itertools
+
+class DeadlineScheduler:
+    # Min-heap of (deadline, seq, key). Rescheduling or cancelling a key only
+    # updates `entries`; stale heap items are skipped when they surface, and
+    # the heap is rebuilt if they start to dominate it. schedule() is
+    # O(log n), cancel() is O(1), and the runner sleeps until the earliest
+    # deadline instead of polling.
+    def __init__(self):
+        self.heap = []
+        self.entries = {}  # key: (deadline, seq, callback)
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.firing = set()  # Callback tasks, referenced until they finish
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def schedule(self, key, delay, callback):
+        # callback is a zero-argument coroutine function run at the deadline.
+        deadline = asyncio.get_running_loop().time() + delay
+        seq = next(self.counter)
+        self.entries[key] = (deadline, seq, callback)
+        heapq.heappush(self.heap, (deadline, seq, key))
+        if self.heap[0][1] == seq:
+            self.wakeup.set()
+        if len(self.heap) > 64 and len(self.heap) > 2 * len(self.entries):
+            self.compact()
+
+    def cancel(self, key):
+        return self.entries.pop(key, None) is not None
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def compact(self):
+        self.heap = [(deadline, seq, key) for key, (deadline, seq, _) in self.entries.items()]
+        heapq.heapify(self.heap)
+
+    def _is_current(self, item):
+        entry = self.entries.get(item[2])
+        return entry is not None and entry[1] == item[1]
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while self.heap and not self._is_current(self.heap[0]):
+                heapq.heappop(self.heap)
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, key = heapq.heappop(self.heap)
+            _, _, callback = self.entries.pop(key)
+            task = asyncio.create_task(self._fire(key, callback))
+            self.firing.add(task)
+            task.add_done_callback(self.firing.discard)
+
+    async def _fire(self, key, callback):
+        try:
+            await callback()
+        except Exception as e:
+            print(f"Scheduled callback {key!r} failed: {e}")
@@ -0,0 +1,145 @@
+import asyncio
+import heapq
+import itertools
+import time
+import discord
+from .metrics import metrics
+
+INTERACTIVE = 0
+BULK = 1
+MAX_MESSAGE_LENGTH = 2000
+
+class ChannelQueue:
+    __slots__ = ("channel", "heap", "tokens", "updated", "paused_until", "worker")
+
+    def __init__(self, channel, capacity):
+        self.channel = channel
+        self.heap = []  # (priority, seq, content, kwargs, merge, future)
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.worker = None
+
+class SendScheduler:
+    # Outbound channel messages go through a per-channel token bucket
+    # (Discord's documented 5 messages per 5 seconds by default) and a
+    # priority queue, so interactive replies overtake bulk output. Queued
+    # messages marked `merge` that are waiting for the same channel are sent
+    # as one message when they fit. A 429 drains the bucket and pauses the
+    # channel for the Retry-After the API returned.
+    def __init__(self, rate=5, per=5.0):
+        self.rate = rate
+        self.per = per
+        self.queues = {}  # channel_id: ChannelQueue
+        self.counter = itertools.count()
+        self.stats = {"requested": 0, "sent": 0, "rate_limited": 0}
+
+    def submit(self, channel, content, priority=INTERACTIVE, merge=False, **kwargs):
+        state = self.queues.get(channel.id)
+        if state is None:
+            state = self.queues[channel.id] = ChannelQueue(channel, self.rate)
+        parts = split_content(content or "")
+        for i, part in enumerate(parts):
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(_consume_exception)
+            # Views, embeds and the like ride on the last part.
+            part_kwargs = kwargs if i == len(parts) - 1 else {}
+            heapq.heappush(state.heap, (priority, next(self.counter), part, part_kwargs, merge, future))
+            self.stats["requested"] += 1
+        if state.worker is None:
+            state.worker = asyncio.create_task(self.drain(state))
+        return future
+
+    async def send(self, channel, content, priority=INTERACTIVE, merge=False, **kwargs):
+        return await self.submit(channel, content, priority=priority, merge=merge, **kwargs)
+
+    async def take_token(self, state):
+        while True:
+            now = time.monotonic()
+            if now < state.paused_until:
+                await asyncio.sleep(state.paused_until - now)
+                continue
+            state.tokens = min(self.rate, state.tokens + (now - state.updated) * self.rate / self.per)
+            state.updated = now
+            if state.tokens >= 1:
+                state.tokens -= 1
+                return
+            await asyncio.sleep((1 - state.tokens) * self.per / self.rate)
+
+    def pop_batch(self, state):
+        batch = [heapq.heappop(state.heap)]
+        priority, _, content, kwargs, merge, _ = batch[0]
+        length = len(content)
+        while merge and not kwargs and state.heap:
+            next_priority, _, next_content, next_kwargs, next_merge, _ = state.heap[0]
+            if not next_merge or next_priority != priority or length + 2 + len(next_content) > MAX_MESSAGE_LENGTH:
+                break
+            batch.append(heapq.heappop(state.heap))
+            length += 2 + len(next_content)
+            kwargs = next_kwargs
+        return batch
+
+    async def drain(self, state):
+        try:
+            while state.heap:
+                await asyncio.sleep(0)  # Let messages submitted in the same tick join the batch
+                await self.take_token(state)
+                await self.deliver(state, self.pop_batch(state))
+        finally:
+            state.worker = None
+
+    async def deliver(self, state, batch):
+        content = "\n\n".join(item[2] for item in batch if item[2]) or None
+        kwargs = batch[-1][3]
+        for attempt in range(2):
+            try:
+                with metrics.timer("leobot_discord_send_seconds"):
+                    message = await state.channel.send(content, **kwargs)
+                self.stats["sent"] += 1
+                break
+            except (discord.RateLimited, discord.HTTPException) as e:
+                if isinstance(e, discord.RateLimited):
+                    retry_after = e.retry_after
+                elif e.status == 429:
+                    retry_after = float(e.response.headers.get("Retry-After", self.per))
+                else:
+                    retry_after = None
+                if retry_after is None or attempt:
+                    print(f"Send to {state.channel.id} failed: {e}")
+                    for item in batch:
+                        if not item[5].done():
+                            item[5].set_exception(e)
+                    return
+                self.stats["rate_limited"] += 1
+                state.tokens = 0
+                state.paused_until = time.monotonic() + retry_after
+                await self.take_token(state)
+        for item in batch:
+            if not item[5].done():
+                item[5].set_result(message)
+
+def split_content(content):
+    # Break oversized messages on line boundaries (or hard-wrap long lines).
+    if len(content) <= MAX_MESSAGE_LENGTH:
+        return [content]
+    parts, current = [], ""
+    for line in content.split("\n"):
+        while len(line) > MAX_MESSAGE_LENGTH:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:MAX_MESSAGE_LENGTH])
+            line = line[MAX_MESSAGE_LENGTH:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > MAX_MESSAGE_LENGTH:
+            parts.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+def _consume_exception(future):
+    # Fire-and-forget sends are logged in deliver(); don't warn again on GC.
+    if not future.cancelled():
+        future.exception()
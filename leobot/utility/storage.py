@@ -0,0 +1,388 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .leaderboard import ALL_TIME
+from .metrics import metrics
+from .player_cards import parse_card
+from .utility_functions import load_json
+
+DB_FILE = 'data/leobot.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    balance INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS token_ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    amount INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS token_ledger_user ON token_ledger (guild_id, user_id, id);
+CREATE TABLE IF NOT EXISTS violations (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS leaderboard (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    score INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS leaderboard_score ON leaderboard (guild_id, score DESC);
+CREATE TABLE IF NOT EXISTS board_scores (
+    guild_id INTEGER NOT NULL,
+    board TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    score INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, board, user_id)
+);
+CREATE TABLE IF NOT EXISTS members (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    color TEXT,
+    playercard TEXT,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS playercards (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (guild_id, user_id, field)
+);
+CREATE TABLE IF NOT EXISTS counters (
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Every table is namespaced by guild. Data from before multi-guild support
+# lives under LEGACY_GUILD until adopt_legacy() hands it to a real guild.
+LEGACY_GUILD = 0
+GUILD_TABLES = {
+    'tokens': 'user_id, balance',
+    'token_ledger': 'id, user_id, amount, reason, created_at',
+    'violations': 'user_id, count',
+    'leaderboard': 'user_id, score',
+    'members': 'user_id, color, playercard',
+    'playercards': 'user_id, field, value',
+    'board_scores': 'board, user_id, score',
+    'counters': 'name, value'
+}
+
+# Legacy whole-file JSON data imported once into the database.
+JSON_TABLES = {
+    'data/tokens.json': ('tokens', 'balance'),
+    'data/violations.json': ('violations', 'count'),
+    'data/trivia_leaderboard.json': ('leaderboard', 'score')
+}
+JSON_MEMBERS = 'data/config.json'
+JSON_ROUNDS = 'data/trivia_rounds.json'
+
+class Storage:
+    # All access goes through a single worker thread that owns the sqlite
+    # connection, so coroutines never block the event loop on disk I/O.
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='leobot-storage')
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self._migrate_guild_keys()
+            self.conn.executescript(SCHEMA)
+            self._migrate_json()
+            self._migrate_playercards()
+        return self.conn
+
+    def _migrate_guild_keys(self):
+        # Databases created before guild namespaces keyed rows by user only;
+        # rebuild those tables with a guild_id column set to LEGACY_GUILD.
+        conn = self.conn
+        old_tables = [
+            table for table in GUILD_TABLES
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            and 'guild_id' not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        ]
+        if not old_tables:
+            return
+        with conn:
+            conn.execute("DROP INDEX IF EXISTS leaderboard_score")
+            for table in old_tables:
+                conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        conn.executescript(SCHEMA)
+        with conn:
+            for table in old_tables:
+                columns = GUILD_TABLES[table]
+                conn.execute(
+                    f"INSERT INTO {table} (guild_id, {columns}) SELECT {LEGACY_GUILD}, {columns} FROM {table}_old"
+                )
+                conn.execute(f"DROP TABLE {table}_old")
+
+    def _migrate_json(self):
+        conn = self.conn
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        with conn:
+            for path, (table, column) in JSON_TABLES.items():
+                rows = [
+                    (LEGACY_GUILD, int(user_id), int(value))
+                    for user_id, value in load_json(path).items() if user_id.isdigit()
+                ]
+                conn.executemany(f"INSERT OR REPLACE INTO {table} (guild_id, user_id, {column}) VALUES (?, ?, ?)", rows)
+            members = [
+                (LEGACY_GUILD, int(user_id), entry.get('color'), entry.get('playercard'))
+                for user_id, entry in load_json(JSON_MEMBERS).items()
+                if user_id.isdigit() and isinstance(entry, dict)
+            ]
+            conn.executemany(
+                "INSERT OR REPLACE INTO members (guild_id, user_id, color, playercard) VALUES (?, ?, ?, ?)", members
+            )
+            rounds = load_json(JSON_ROUNDS).get('rounds', 0)
+            conn.execute(
+                "INSERT OR REPLACE INTO counters (guild_id, name, value) VALUES (?, 'trivia_rounds', ?)",
+                (LEGACY_GUILD, rounds)
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+
+    def _migrate_playercards(self):
+        # Cards used to be stored as rendered Markdown; split them into fields.
+        conn = self.conn
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'playercards_migrated'").fetchone():
+            return
+        rows = conn.execute("SELECT guild_id, user_id, playercard FROM members WHERE playercard IS NOT NULL").fetchall()
+        with conn:
+            for guild_id, user_id, text in rows:
+                fields = parse_card(text)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO playercards (guild_id, user_id, field, value) VALUES (?, ?, ?, ?)",
+                    [(guild_id, user_id, field, value) for field, value in fields.items()]
+                )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('playercards_migrated', '1')")
+
+    async def run(self, func, *args):
+        def call():
+            return func(self._connect(), *args)
+        with metrics.timer("leobot_storage_seconds", operation=func.__name__.lstrip('_')):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def close(self):
+        def close_conn():
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        await asyncio.get_running_loop().run_in_executor(self.executor, close_conn)
+        self.executor.shutdown(wait=True)
+
+    async def adopt_legacy(self, guild_id):
+        # Hands pre-multi-guild data to `guild_id`. Only the first call does anything.
+        return await self.run(_adopt_legacy, guild_id)
+
+    # Tokens
+
+    # `token_ledger` is the append-only record of every change; `tokens` is a
+    # snapshot of the balances up to ledger id `token_snapshot` in meta.
+
+    async def append_ledger(self, guild_id, amounts, reason):
+        return await self.run(_append_ledger, guild_id, amounts, reason, int(time.time()))
+
+    async def load_token_balances(self):
+        return await self.run(_load_token_balances)
+
+    async def snapshot_tokens(self):
+        return await self.run(_snapshot_tokens)
+
+    async def token_history(self, guild_id, user_id, limit=10):
+        return await self.run(_token_history, guild_id, user_id, limit)
+
+    # Violations
+
+    async def add_violation(self, guild_id, user_id):
+        return (await self.run(_increment, 'violations', 'count', guild_id, {user_id: 1}))[user_id]
+
+    # Trivia leaderboard
+
+    async def add_scores(self, guild_id, scores, boards=()):
+        # The all-time leaderboard plus any named boards (category, season).
+        return await self.run(_add_scores, guild_id, scores, boards)
+
+    async def all_scores(self):
+        return await self.run(_all_scores)
+
+    async def increment_counter(self, guild_id, name, amount=1):
+        return await self.run(_increment_counter, guild_id, name, amount)
+
+    # Members
+
+    async def set_member_color(self, guild_id, user_id, color):
+        await self.run(_set_member_field, guild_id, user_id, 'color', color)
+
+    # Player cards
+
+    async def set_playercard(self, guild_id, user_id, fields):
+        await self.run(_set_playercard, guild_id, user_id, fields)
+
+    async def set_playercard_field(self, guild_id, user_id, field, value):
+        await self.run(_set_playercard_field, guild_id, user_id, field, value)
+
+    async def all_playercards(self):
+        return await self.run(_all_playercards)
+
+def _adopt_legacy(conn, guild_id):
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_guild'").fetchone():
+        return False
+    with conn:
+        for table in GUILD_TABLES:
+            # Rows the guild already has win over legacy ones.
+            conn.execute(
+                f"UPDATE OR IGNORE {table} SET guild_id = ? WHERE guild_id = ?", (int(guild_id), LEGACY_GUILD)
+            )
+            conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (LEGACY_GUILD,))
+        conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_guild', ?)", (str(guild_id),))
+    return True
+
+def _append_ledger(conn, guild_id, amounts, reason, created_at):
+    # One transaction per call, however many users it pays.
+    with conn:
+        conn.executemany(
+            "INSERT INTO token_ledger (guild_id, user_id, amount, reason, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(int(guild_id), int(user_id), amount, reason, created_at) for user_id, amount in amounts.items()]
+        )
+
+def _snapshot_id(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'token_snapshot'").fetchone()
+    return int(row[0]) if row else 0
+
+def _load_token_balances(conn):
+    # Snapshot plus the ledger tail replayed on top of it. Returns
+    # ({(guild_id, user_id): balance}, entries in the tail).
+    balances = {(guild_id, user_id): balance for guild_id, user_id, balance in conn.execute(
+        "SELECT guild_id, user_id, balance FROM tokens"
+    )}
+    tail = 0
+    for guild_id, user_id, amount, count in conn.execute(
+        "SELECT guild_id, user_id, SUM(amount), COUNT(*) FROM token_ledger WHERE id > ? GROUP BY guild_id, user_id",
+        (_snapshot_id(conn),)
+    ):
+        balances[(guild_id, user_id)] = balances.get((guild_id, user_id), 0) + amount
+        tail += count
+    return balances, tail
+
+def _snapshot_tokens(conn):
+    # Folds the ledger tail into the snapshot; returns the entries folded.
+    with conn:
+        start = _snapshot_id(conn)
+        end = conn.execute("SELECT COALESCE(MAX(id), 0) FROM token_ledger").fetchone()[0]
+        if end <= start:
+            return 0
+        conn.execute(
+            "INSERT INTO tokens (guild_id, user_id, balance) "
+            "SELECT guild_id, user_id, SUM(amount) FROM token_ledger WHERE id > ? AND id <= ? GROUP BY guild_id, user_id "
+            "ON CONFLICT(guild_id, user_id) DO UPDATE SET balance = balance + excluded.balance",
+            (start, end)
+        )
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('token_snapshot', ?)", (str(end),))
+    return end - start
+
+def _token_history(conn, guild_id, user_id, limit):
+    return conn.execute(
+        "SELECT amount, reason, created_at FROM token_ledger WHERE guild_id = ? AND user_id = ? "
+        "ORDER BY id DESC LIMIT ?",
+        (int(guild_id), int(user_id), limit)
+    ).fetchall()
+
+def _increment(conn, table, column, guild_id, amounts):
+    # One transaction for the whole batch; returns {user_id: new_value}.
+    with conn:
+        return _increment_rows(conn, table, column, guild_id, amounts)
+
+def _increment_rows(conn, table, column, guild_id, amounts):
+    results = {}
+    for user_id, amount in amounts.items():
+        row = conn.execute(
+            f"INSERT INTO {table} (guild_id, user_id, {column}) VALUES (?, ?, ?) "
+            f"ON CONFLICT(guild_id, user_id) DO UPDATE SET {column} = {column} + excluded.{column} "
+            f"RETURNING {column}",
+            (int(guild_id), int(user_id), amount)
+        ).fetchone()
+        results[user_id] = row[0]
+    return results
+
+def _add_scores(conn, guild_id, scores, boards):
+    with conn:
+        totals = _increment_rows(conn, 'leaderboard', 'score', guild_id, scores)
+        conn.executemany(
+            "INSERT INTO board_scores (guild_id, board, user_id, score) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, board, user_id) DO UPDATE SET score = score + excluded.score",
+            [(int(guild_id), board, int(user_id), score) for board in boards for user_id, score in scores.items()]
+        )
+    return totals
+
+def _all_scores(conn):
+    # (guild_id, board, user_id, score) for every board, the all-time one as ALL_TIME.
+    return conn.execute(
+        "SELECT guild_id, ?, user_id, score FROM leaderboard "
+        "UNION ALL SELECT guild_id, board, user_id, score FROM board_scores",
+        (ALL_TIME,)
+    ).fetchall()
+
+def _increment_counter(conn, guild_id, name, amount):
+    with conn:
+        row = conn.execute(
+            "INSERT INTO counters (guild_id, name, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(guild_id, name) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (int(guild_id), name, amount)
+        ).fetchone()
+    return row[0]
+
+def _set_member_field(conn, guild_id, user_id, column, value):
+    with conn:
+        conn.execute(
+            f"INSERT INTO members (guild_id, user_id, {column}) VALUES (?, ?, ?) "
+            f"ON CONFLICT(guild_id, user_id) DO UPDATE SET {column} = excluded.{column}",
+            (int(guild_id), int(user_id), value)
+        )
+
+def _set_playercard(conn, guild_id, user_id, fields):
+    # Replaces the whole card in one transaction.
+    with conn:
+        conn.execute("DELETE FROM playercards WHERE guild_id = ? AND user_id = ?", (int(guild_id), int(user_id)))
+        conn.executemany(
+            "INSERT INTO playercards (guild_id, user_id, field, value) VALUES (?, ?, ?, ?)",
+            [(int(guild_id), int(user_id), field, value) for field, value in fields.items()]
+        )
+
+def _set_playercard_field(conn, guild_id, user_id, field, value):
+    with conn:
+        conn.execute(
+            "INSERT INTO playercards (guild_id, user_id, field, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, user_id, field) DO UPDATE SET value = excluded.value",
+            (int(guild_id), int(user_id), field, value)
+        )
+
+def _all_playercards(conn):
+    # {guild_id: {user_id: {field: value}}}
+    cards = {}
+    for guild_id, user_id, field, value in conn.execute("SELECT guild_id, user_id, field, value FROM playercards"):
+        cards.setdefault(guild_id, {}).setdefault(user_id, {})[field] = value
+    return cards
@@ -0,0 +1,78 @@
+import asyncio
+
+CHUNK_PROMPT = "Summarize this part of a conversation briefly, keeping the main topics and any conclusions. Do not list user names:\n"
+REDUCE_PROMPT = "These are summaries of consecutive parts of one conversation. Combine them into one brief summary focusing on hot topics discussed. Do not list user names:\n"
+FINAL_PROMPT = "Summarize the following conversation briefly, focusing on hot topics discussed. Do not list user names:\n"
+
+def estimate_tokens(text):
+    # Rough but cheap: about four characters per token for English chat.
+    return len(text) // 4 + 1
+
+class MapReduceSummarizer:
+    # Splits a stream of lines into token-budgeted chunks, summarizes chunks
+    # concurrently as soon as each one fills, then folds the partial
+    # summaries together. complete(prompt) performs one model call.
+    def __init__(self, complete, chunk_tokens=3000, concurrency=4, max_input_tokens=60000):
+        self.complete = complete
+        self.chunk_tokens = chunk_tokens
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_input_tokens = max_input_tokens
+        self.truncated = False
+        self.chunks_total = 0
+        self.chunks_done = 0
+
+    async def call(self, prompt):
+        async with self.semaphore:
+            return await self.complete(prompt)
+
+    async def summarize_chunk(self, lines, on_progress):
+        result = await self.call(CHUNK_PROMPT + "\n".join(lines))
+        self.chunks_done += 1
+        if on_progress:
+            await on_progress(self.chunks_done, self.chunks_total)
+        return result
+
+    def start_chunk(self, lines, on_progress):
+        self.chunks_total += 1
+        return asyncio.create_task(self.summarize_chunk(lines, on_progress))
+
+    async def summarize(self, lines, on_progress=None):
+        # `lines` is an async iterable so history can be read while earlier
+        # chunks are already being summarized.
+        tasks = []
+        chunk, chunk_size, total = [], 0, 0
+        async for line in lines:
+            size = estimate_tokens(line)
+            if total + size > self.max_input_tokens:
+                self.truncated = True
+                break
+            if chunk and chunk_size + size > self.chunk_tokens:
+                tasks.append(self.start_chunk(chunk, on_progress))
+                chunk, chunk_size = [], 0
+            chunk.append(line)
+            chunk_size += size
+            total += size
+        if not tasks:
+            return await self.call(FINAL_PROMPT + "\n".join(chunk)) if chunk else None
+        if chunk:
+            tasks.append(self.start_chunk(chunk, on_progress))
+        partials = await asyncio.gather(*tasks)
+        return await self.reduce(partials)
+
+    async def reduce(self, partials):
+        # Fold groups of partial summaries that fit the chunk budget until
+        # one summary remains.
+        while len(partials) > 1:
+            groups, group, group_size = [], [], 0
+            for partial in partials:
+                size = estimate_tokens(partial)
+                if group and group_size + size > self.chunk_tokens:
+                    groups.append(group)
+                    group, group_size = [], 0
+                group.append(partial)
+                group_size += size
+            groups.append(group)
+            if len(groups) == len(partials):
+                groups = [partials]  # Partials too large to pair up; combine them all at once.
+            partials = await asyncio.gather(*(self.call(REDUCE_PROMPT + "\n\n".join(g)) for g in groups))
+        return partials[0]
@@ -0,0 +1,50 @@
+import asyncio
+
+SNAPSHOT_EVERY = 1000  # Ledger entries between snapshots
+
+class TokenLedger:
+    # Sleep token balances. Every change is appended to the ledger table in
+    # storage, never updated in place; balances are served from an in-memory
+    # index. On startup the index is rebuilt from the last snapshot plus the
+    # ledger entries after it, and every SNAPSHOT_EVERY entries the tail is
+    # folded into a new snapshot so that replay stays short.
+    def __init__(self, storage, snapshot_every=SNAPSHOT_EVERY):
+        self.storage = storage
+        self.snapshot_every = snapshot_every
+        self.balances = {}  # (guild_id, user_id): balance
+        self.tail = 0  # Ledger entries since the last snapshot
+        self.snapshot_task = None
+
+    async def load(self):
+        self.balances, self.tail = await self.storage.load_token_balances()
+
+    def balance(self, guild_id, user_id):
+        return self.balances.get((guild_id, user_id), 0)
+
+    async def post(self, guild_id, amounts, reason):
+        # amounts: {user_id: delta}, committed as one transaction. Returns
+        # {user_id: new balance}. Storage runs writes one at a time, in
+        # order, so concurrent posts can't lose each other's updates.
+        amounts = {user_id: amount for user_id, amount in amounts.items() if amount}
+        if not amounts:
+            return {}
+        await self.storage.append_ledger(guild_id, amounts, reason)
+        results = {}
+        for user_id, amount in amounts.items():
+            key = (guild_id, user_id)
+            results[user_id] = self.balances[key] = self.balances.get(key, 0) + amount
+        self.tail += len(amounts)
+        if self.tail >= self.snapshot_every and (self.snapshot_task is None or self.snapshot_task.done()):
+            self.snapshot_task = asyncio.create_task(self.snapshot())
+        return results
+
+    async def snapshot(self):
+        try:
+            folded = await self.storage.snapshot_tokens()
+        except Exception as e:
+            print(f"Token snapshot failed: {e}")
+            return
+        self.tail = max(self.tail - folded, 0)
+
+    async def history(self, guild_id, user_id, limit=10):
+        return await self.storage.token_history(guild_id, user_id, limit)
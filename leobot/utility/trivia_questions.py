@@ -0,0 +1,136 @@
+import asyncio
+import random
+import time
+from collections import deque
+from html import unescape
+import aiohttp
+
+TOKEN_URL = "https://opentdb.com/api_token.php?command=request"
+QUESTIONS_URL = "https://opentdb.com/api.php"
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=5)
+REQUEST_INTERVAL = 5.0  # Open TDB allows one request per IP every 5 seconds
+BATCH_SIZE = 50  # Largest amount Open TDB returns per request
+
+class QuestionPool:
+    # Buffers decoded, shuffled questions per (category, difficulty). Refills
+    # ask for a whole category at once (all difficulties mixed) and bucket the
+    # results, so one request tops up three buffers.
+    def __init__(self, http_pool, category_map, difficulty_map, target=10):
+        self.http_pool = http_pool
+        self.category_map = category_map
+        self.difficulty_map = difficulty_map
+        self.target = target
+        self.buffers = {
+            (category, difficulty): deque()
+            for category in category_map for difficulty in difficulty_map
+        }
+        self.session_token = None
+        self.refills = {}  # category: asyncio.Task
+        self.request_lock = asyncio.Lock()
+        self.last_request = 0.0
+
+    async def request(self, url, params=None):
+        # Serialize requests and space them out to stay under the rate limit.
+        async with self.request_lock:
+            wait = self.last_request + REQUEST_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with self.http_pool.session.get(url, params=params, timeout=REQUEST_TIMEOUT) as resp:
+                    if resp.status != 200:
+                        return None
+                    return await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return None
+            finally:
+                self.last_request = time.monotonic()
+
+    async def fetch_session_token(self):
+        data = await self.request(TOKEN_URL)
+        if data and data.get("response_code") == 0:
+            self.session_token = data["token"]
+        return self.session_token
+
+    async def fetch(self, category, difficulty=None, amount=BATCH_SIZE):
+        params = {"amount": amount, "category": self.category_map[category], "type": "multiple"}
+        if difficulty:
+            params["difficulty"] = self.difficulty_map[difficulty]
+        if self.session_token is None:
+            await self.fetch_session_token()
+        if self.session_token:
+            params["token"] = self.session_token
+        data = await self.request(QUESTIONS_URL, params)
+        if data and data.get("response_code") == 1 and amount > self.target:
+            # Not enough questions left for a full batch; settle for fewer.
+            params["amount"] = self.target
+            data = await self.request(QUESTIONS_URL, params)
+        if data and data.get("response_code") in (3, 4):
+            # Token missing or exhausted: get a fresh one and try once more.
+            self.session_token = None
+            if await self.fetch_session_token():
+                params["token"] = self.session_token
+            else:
+                params.pop("token", None)
+            data = await self.request(QUESTIONS_URL, params)
+        if not data or data.get("response_code") != 0:
+            return 0
+        labels = {level: name for name, level in self.difficulty_map.items()}
+        added = 0
+        for q in data["results"]:
+            label = labels.get(q["difficulty"])
+            if label is None:
+                continue
+            self.buffers[(category, label)].append(decode_question(q, category, label))
+            added += 1
+        return added
+
+    def needs_refill(self, category):
+        return any(len(self.buffers[(category, difficulty)]) < self.target for difficulty in self.difficulty_map)
+
+    async def refill(self, category):
+        try:
+            for _ in range(2):
+                if not self.needs_refill(category) or not await self.fetch(category):
+                    break
+        finally:
+            self.refills.pop(category, None)
+
+    def warm(self, categories):
+        for category in categories:
+            if category in self.category_map and category not in self.refills and self.needs_refill(category):
+                self.refills[category] = asyncio.create_task(self.refill(category))
+
+    async def fill_all(self):
+        for category in self.category_map:
+            self.warm([category])
+            task = self.refills.get(category)
+            if task:
+                await task
+
+    async def take(self, category, difficulty, count):
+        key = (category, difficulty)
+        if key not in self.buffers:
+            return []
+        task = self.refills.get(category)
+        if task and len(self.buffers[key]) < count:
+            await task
+        if len(self.buffers[key]) < count:
+            await self.fetch(category, difficulty, amount=count)
+        buffer = self.buffers[key]
+        questions = [buffer.popleft() for _ in range(min(count, len(buffer)))]
+        self.warm([category])
+        return questions
+
+def decode_question(q, category, difficulty):
+    question_text = unescape(q["question"])
+    correct_answer = unescape(q["correct_answer"])
+    incorrect_answers = [unescape(ans) for ans in q["incorrect_answers"]]
+    options = incorrect_answers + [correct_answer]
+    random.shuffle(options)
+    return {
+        "category": category,
+        "difficulty": difficulty,
+        "question": question_text,
+        "options": options,
+        "answer": options.index(correct_answer)
+    }
@@ -0,0 +1,48 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+WHITESPACE = re.compile(r"\s+")
+REPEATED_CHARS = re.compile(r"(.)\1{2,}")
+
+def normalize_text(text):
+    # Case, spacing and stretched letters ("loooool") shouldn't change the key.
+    text = WHITESPACE.sub(" ", text.strip().lower())
+    return REPEATED_CHARS.sub(r"\1\1", text)
+
+def text_key(text):
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+class TTLCache:
+    # LRU cache whose entries also expire `ttl` seconds after being set.
+    def __init__(self, max_size=1024, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key: (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,4 +1,7 @@
 import json
+import os
+import tempfile
+from .metrics import metrics
 
 def load_json(file):
     try:
@@ -7,6 +10,19 @@ def load_json(file):
     except (FileNotFoundError, json.JSONDecodeError):
         return {}
 
-def save_json(file, data):
-    with open(file, 'w') as f:
-        json.dump(data, f, indent=4)
+def write_atomic(file, text):
+    # Write to a temp file in the same directory and rename it over the
+    # target, so a crash mid-write never leaves a truncated file behind.
+    with metrics.timer("leobot_disk_write_seconds"):
+        directory = os.path.dirname(file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise